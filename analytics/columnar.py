@@ -0,0 +1,104 @@
+# analytics/columnar.py
+# Packet history as Parquet or Arrow IPC files, written and read in batches
+import numpy as np
+import sys
+sys.path.append('..')
+from utils.config import EXPORT_CHUNK_SIZE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only the analytics tools need it
+    pa = pq = None
+
+FORMATS = ('parquet', 'arrow')
+COLUMNS = ('id', 'source_ip', 'dest_ip', 'packet_size', 'protocol', 'timestamp', 'anomaly_flag', 'model_version')
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for columnar export and offline analytics (pip install pyarrow)")
+
+def packet_schema():
+    """Arrow schema of exported packets (the columns of the packets table)"""
+    require_pyarrow()
+    return pa.schema([
+        ('id', pa.int64()),
+        ('source_ip', pa.string()),
+        ('dest_ip', pa.string()),
+        ('packet_size', pa.int32()),
+        ('protocol', pa.string()),
+        ('timestamp', pa.timestamp('us')),
+        ('anomaly_flag', pa.bool_()),
+        ('model_version', pa.int32())
+    ])
+
+def file_format(path, fmt=None):
+    """'parquet' or 'arrow', from `fmt` or the file extension"""
+    if fmt:
+        return fmt
+    return 'arrow' if path.endswith(('.arrow', '.feather', '.ipc')) else 'parquet'
+
+def rows_to_batch(rows, schema):
+    """Turn row tuples (in schema column order) into one record batch"""
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+    )
+
+class BatchWriter:
+    """Append record batches to a Parquet file (one row group each) or an Arrow IPC file"""
+
+    def __init__(self, path, schema, fmt=None):
+        require_pyarrow()
+        self.format = file_format(path, fmt)
+        self.rows = 0
+        if self.format == 'parquet':
+            self.writer = pq.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self.sink = pa.OSFile(path, 'wb')
+            self.writer = pa.ipc.new_file(self.sink, schema)
+
+    def write(self, batch):
+        if self.format == 'parquet':
+            self.writer.write_batch(batch, row_group_size=max(len(batch), 1))
+        else:
+            self.writer.write_batch(batch)
+        self.rows += len(batch)
+
+    def close(self):
+        self.writer.close()
+        if self.format == 'arrow':
+            self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def read_batches(path, columns=None, batch_size=EXPORT_CHUNK_SIZE, fmt=None):
+    """Yield record batches of a Parquet or Arrow file, reading only `columns`"""
+    require_pyarrow()
+    if file_format(path, fmt) == 'parquet':
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns)
+        return
+    # Memory-mapped: batches are views of the file, not copies
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            yield batch.select(columns) if columns else batch
+
+def dictionary_codes(column):
+    """(codes, values) of a string column: codes index into the distinct values"""
+    encoded = column.dictionary_encode()
+    codes = encoded.indices.to_numpy(zero_copy_only=False)
+    return codes, encoded.dictionary.to_pylist()
+
+def unix_seconds(column):
+    """Timestamp column as float seconds since the epoch"""
+    return column.cast(pa.int64()).to_numpy(zero_copy_only=False) / 1e6
+
+def numeric(column, dtype=np.float64):
+    return column.to_numpy(zero_copy_only=False).astype(dtype, copy=False)
@@ -0,0 +1,58 @@
+# analytics/export.py
+# Stream the packets table (or a time range of it) into a Parquet or Arrow file.
+#
+#   cd analytics
+#   python export.py packets.parquet
+#   python export.py last_day.arrow --since 2026-10-17T00:00 --until 2026-10-18T00:00
+#
+# Rows are read through a server-side cursor EXPORT_CHUNK_SIZE at a time and
+# each chunk becomes one row group / record batch, so memory stays flat.
+import argparse
+import os
+import time
+from datetime import datetime
+import sys
+sys.path.append('..')
+from utils.config import EXPORT_CHUNK_SIZE
+from columnar import FORMATS, BatchWriter, packet_schema, rows_to_batch
+
+def export_packets(db, path, since=None, until=None, fmt=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write packets with since <= timestamp < until to `path`; returns the row count
+
+    If the stream fails, the partial file is removed rather than left to pass
+    for a complete export.
+    """
+    schema = packet_schema()
+    try:
+        with BatchWriter(path, schema, fmt) as writer:
+            for rows in db.iter_packets(since, until, chunk_size):
+                writer.write(rows_to_batch(rows, schema))
+                print(f"📦 {writer.rows} rows exported...", end='\r')
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return writer.rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Export packet history to Parquet or Arrow")
+    parser.add_argument('path', help="Output file (.parquet, or .arrow for Arrow IPC)")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="Oldest timestamp to include (ISO)")
+    parser.add_argument('--until', type=datetime.fromisoformat, help="Exclusive upper timestamp bound (ISO)")
+    parser.add_argument('--format', choices=FORMATS, help="Override the format implied by the extension")
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from database.db import Database
+    db = Database()
+    start = time.perf_counter()
+    try:
+        count = export_packets(db, args.path, args.since, args.until, args.format, args.chunk_size)
+    except RuntimeError as e:
+        sys.exit(f"❌ {e}")
+    finally:
+        db.close()
+    print(f"✅ Exported {count} packets to {args.path} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# analytics/offline.py
+# Aggregate stats, rescoring and retraining experiments over exported packet
+# files, without touching the live database.
+#
+#   cd analytics
+#   python offline.py stats packets.parquet
+#   python offline.py score packets.parquet --output scored.parquet
+#   python offline.py score packets.parquet --version 12      # a specific registry version
+#   python offline.py train packets.parquet                   # fit on the file; --publish to register it
+import argparse
+import contextlib
+import io
+import json
+import time
+from collections import Counter
+import numpy as np
+import sys
+sys.path.append('..')
+from utils.config import EXPORT_CHUNK_SIZE, TRAIN_SAMPLE_SIZE
+from ml.features import FlowFeatureEngine
+from columnar import pa, BatchWriter, read_batches, dictionary_codes, unix_seconds, numeric
+
+def packet_stats(path, top=10, batch_size=EXPORT_CHUNK_SIZE):
+    """Totals, per-protocol breakdown, busiest minutes and top talkers, computed per batch with NumPy"""
+    totals = {'total': 0, 'anomalies': 0, 'bytes': 0}
+    protocols = {}
+    minutes = Counter()
+    sources = Counter()
+
+    for batch in read_batches(path, ['source_ip', 'packet_size', 'protocol', 'timestamp', 'anomaly_flag'],
+                              batch_size):
+        sizes = numeric(batch.column('packet_size'), np.int64)
+        flags = numeric(batch.column('anomaly_flag'), bool)
+        totals['total'] += len(sizes)
+        totals['anomalies'] += int(flags.sum())
+        totals['bytes'] += int(sizes.sum())
+
+        codes, names = dictionary_codes(batch.column('protocol'))
+        counts = np.bincount(codes, minlength=len(names))
+        anomalies = np.bincount(codes, weights=flags, minlength=len(names))
+        size_sums = np.bincount(codes, weights=sizes, minlength=len(names))
+        for i, name in enumerate(names):
+            entry = protocols.setdefault(name, {'total': 0, 'anomalies': 0, 'bytes': 0})
+            entry['total'] += int(counts[i])
+            entry['anomalies'] += int(anomalies[i])
+            entry['bytes'] += int(size_sums[i])
+
+        buckets, counts = np.unique((unix_seconds(batch.column('timestamp')) // 60).astype(np.int64),
+                                    return_counts=True)
+        minutes.update(dict(zip(buckets.tolist(), counts.tolist())))
+
+        codes, names = dictionary_codes(batch.column('source_ip'))
+        counts = np.bincount(codes, minlength=len(names))
+        sources.update(dict(zip(names, counts.tolist())))
+
+    totals['protocols'] = protocols
+    totals['busiest_minutes'] = [
+        {'minute': time.strftime('%Y-%m-%d %H:%M', time.gmtime(bucket * 60)), 'packets': count}
+        for bucket, count in minutes.most_common(top)
+    ]
+    totals['top_sources'] = [{'source_ip': ip, 'packets': count} for ip, count in sources.most_common(top)]
+    return totals
+
+def offline_detector():
+    """AnomalyDetector without a model or flow state of its own; it never bootstraps the registry
+
+    Bulk scoring uses the sklearn estimator, which is faster than the
+    compiled forest at file batch sizes.
+    """
+    from ml.anomaly_model import AnomalyDetector
+    with contextlib.redirect_stdout(io.StringIO()):
+        return AnomalyDetector(backend='sklearn', load=False)
+
+def load_detector(version=None):
+    """offline_detector() on the current (or given) registry version; RuntimeError if there is none
+
+    Only loads: an empty registry is reported rather than filled with a new
+    model that running servers would then switch to.
+    """
+    detector = offline_detector()
+    registry = detector.registry
+    if version is None:
+        version = registry.current_version()
+        if version is None:
+            raise RuntimeError("The model registry is empty; start the ingest server once or run 'train --publish'")
+    elif version not in registry.versions():
+        raise RuntimeError(f"Model version {version} does not exist")
+    detector.model = registry.load(version)
+    detector.model_version = version
+    return detector
+
+def score_packets(path, detector, output=None, batch_size=EXPORT_CHUNK_SIZE):
+    """Rescore every packet in the file; returns a comparison with the stored flags
+
+    Flow features are rebuilt by replaying the file in order through a fresh
+    engine, as training does. With `output`, the file is copied with
+    `anomaly_score` (the model's decision function; negative = anomalous)
+    and `predicted_flag` columns added.
+    """
+    model = detector.model
+    flows = FlowFeatureEngine() if detector.uses_flow_features(model) else None
+    protocol_codes = detector.protocol_codes
+    report = {'rows': 0, 'flagged': 0, 'stored_flagged': 0, 'newly_flagged': 0, 'cleared': 0}
+    writer = None
+
+    try:
+        for batch in read_batches(path, batch_size=batch_size):
+            sizes = numeric(batch.column('packet_size'))
+            codes, names = dictionary_codes(batch.column('protocol'))
+            # Map the batch's distinct protocols once, then gather
+            protocol_encoded = np.array([protocol_codes.get(name, -1) for name in names], dtype=np.int64)[codes]
+            X = np.column_stack([sizes, protocol_encoded])
+            if flows is not None:
+                X = np.column_stack([X, flows.update_batch(
+                    batch.column('source_ip').to_pylist(), batch.column('dest_ip').to_pylist(), sizes,
+                    unix_seconds(batch.column('timestamp'))
+                )])
+
+            # Unknown protocols are reported as normal, like AnomalyDetector.predict_batch
+            scores = np.full(len(sizes), np.nan)
+            known = protocol_encoded >= 0
+            if known.any():
+                scores[known] = model.decision_function(X[known])
+            predicted = scores < 0
+            stored = numeric(batch.column('anomaly_flag'), bool)
+
+            report['rows'] += len(sizes)
+            report['flagged'] += int(predicted.sum())
+            report['stored_flagged'] += int(stored.sum())
+            report['newly_flagged'] += int((predicted & ~stored).sum())
+            report['cleared'] += int((stored & ~predicted).sum())
+
+            if output:
+                scored = batch.append_column('anomaly_score', pa.array(scores)) \
+                              .append_column('predicted_flag', pa.array(predicted))
+                if writer is None:
+                    writer = BatchWriter(output, scored.schema)
+                writer.write(scored)
+    finally:
+        if writer is not None:
+            writer.close()
+    report['model_version'] = detector.model_version
+    return report
+
+def train_on_file(path, detector, sample_size=TRAIN_SAMPLE_SIZE, publish=False, batch_size=EXPORT_CHUNK_SIZE):
+    """Fit a new model on a reservoir sample of the file (in file order, for flow replay)"""
+    flows = detector.flows is not None
+
+    def batches():
+        for batch in read_batches(path, batch_size=batch_size):
+            sizes = numeric(batch.column('packet_size'))
+            protocols = batch.column('protocol').to_pylist()
+            if not flows:
+                yield sizes, protocols, None, None, None
+                continue
+            yield (sizes, protocols, batch.column('source_ip').to_pylist(), batch.column('dest_ip').to_pylist(),
+                   unix_seconds(batch.column('timestamp')))
+
+    return detector.train_from_batches(batches(), sample_size, publish=publish)
+
+def print_stats(stats):
+    print(f"📊 {stats['total']} packets | {stats['anomalies']} flagged | {stats['bytes']} bytes")
+    for name, entry in sorted(stats['protocols'].items()):
+        print(f"   {name:<6} {entry['total']:>12} packets {entry['anomalies']:>10} flagged {entry['bytes']:>14} bytes")
+    print("⏱️ Busiest minutes:")
+    for entry in stats['busiest_minutes']:
+        print(f"   {entry['minute']}  {entry['packets']}")
+    print("📡 Top sources:")
+    for entry in stats['top_sources']:
+        print(f"   {entry['source_ip']:<15} {entry['packets']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline analytics over exported packet files")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stats = commands.add_parser('stats', help="Aggregate statistics")
+    stats.add_argument('path')
+    stats.add_argument('--top', type=int, default=10)
+    stats.add_argument('--json', action='store_true')
+
+    score = commands.add_parser('score', help="Rescore packets with a model version")
+    score.add_argument('path')
+    score.add_argument('--version', type=int, help="Registry version (default: current)")
+    score.add_argument('--output', help="Write the packets with anomaly_score and predicted_flag columns")
+    score.add_argument('--json', action='store_true')
+
+    train = commands.add_parser('train', help="Fit a model on the file")
+    train.add_argument('path')
+    train.add_argument('--sample-size', type=int, default=TRAIN_SAMPLE_SIZE)
+    train.add_argument('--publish', action='store_true', help="Publish the model as a new registry version")
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    try:
+        if args.command == 'stats':
+            result = packet_stats(args.path, args.top)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print_stats(result)
+        elif args.command == 'score':
+            result = score_packets(args.path, load_detector(args.version), args.output)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"🔍 Model v{result['model_version']}: {result['flagged']} of {result['rows']} flagged "
+                      f"(stored: {result['stored_flagged']}; newly flagged {result['newly_flagged']}, "
+                      f"cleared {result['cleared']})")
+        else:
+            detector = offline_detector()
+            if train_on_file(args.path, detector, args.sample_size, args.publish) and args.publish:
+                print(f"✅ Published as v{detector.model_version}")
+    except RuntimeError as e:
+        sys.exit(f"❌ {e}")
+    print(f"⏱️ Done in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# benchmarks/bench_api.py
+# Requests/sec and latency of the read API under concurrent clients.
+#
+#   cd benchmarks
+#   python bench_api.py                                  # against an API already running on FLASK_PORT
+#   python bench_api.py --serve gunicorn --query-ms 5    # start gunicorn with a stub database first
+#   python bench_api.py --serve dev --no-cache           # Flask dev server, response cache off
+#
+# --serve starts the API in a child process. With --db stub (the default)
+# every read sleeps --query-ms to stand in for a PostgreSQL round trip.
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import runpy
+import threading
+import time
+import numpy as np
+import sys
+sys.path.append('..')
+sys.path.append('../web')
+from utils.config import FLASK_PORT
+from stubs import NullDatabase
+
+DEFAULT_PATHS = ('/api/packets?limit=100', '/api/stats')
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web', 'gunicorn.conf.py')
+
+def load_app(args):
+    """The Flask app, with the stub database and cache setting applied"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as web_app
+    if args.db == 'stub':
+        web_app.db = NullDatabase(query_delay=args.query_ms / 1000)
+    if args.no_cache:
+        web_app.response_cache.ttl = 0
+    return web_app.app
+
+def run_gunicorn(application, args):
+    """Serve with the settings of web/gunicorn.conf.py, overriding bind and workers"""
+    from gunicorn.app.base import BaseApplication
+
+    class Standalone(BaseApplication):
+        def load_config(self):
+            conf = runpy.run_path(GUNICORN_CONF)
+            for key, value in conf.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+            self.cfg.set('bind', f"127.0.0.1:{args.port}")
+            if args.workers:
+                self.cfg.set('workers', args.workers)
+
+        def load(self):
+            return application
+
+    Standalone().run()
+
+def serve(args):
+    """API server process"""
+    sys.stdout = open(os.devnull, 'w')
+    application = load_app(args)
+    if args.serve == 'gunicorn':
+        run_gunicorn(application, args)
+    else:
+        application.run(host='127.0.0.1', port=args.port, threaded=True)
+
+def wait_until_up(port, timeout):
+    """Poll /api/health until the server answers"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/health')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def client(host, port, path, stop_at, etag, latencies, errors):
+    """One keep-alive connection issuing requests back to back until stop_at"""
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    headers = {}
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status not in (200, 304):
+            errors.append(response.status)
+        elif etag and response.getheader('ETag'):
+            headers['If-None-Match'] = response.getheader('ETag')
+    conn.close()
+
+def bench_path(args, path):
+    """Run args.concurrency clients against one path; returns the report"""
+    latencies, errors = [], []
+    stop_at = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(args.host, args.port, path, stop_at, args.etag, latencies, errors))
+        for _ in range(args.concurrency)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    latencies = np.array(latencies)
+    return {
+        'path': path,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="NetSentinel API benchmark")
+    parser.add_argument('paths', nargs='*', help=f"Request paths (default: {' '.join(DEFAULT_PATHS)})")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=FLASK_PORT)
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent keep-alive connections")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per path")
+    parser.add_argument('--etag', action='store_true', help="Revalidate with If-None-Match like a browser")
+    parser.add_argument('--serve', choices=('none', 'dev', 'gunicorn'), default='none',
+                        help="Start the API in a child process first")
+    parser.add_argument('--db', choices=('stub', 'postgres'), default='stub', help="Database of a --serve'd API")
+    parser.add_argument('--query-ms', type=float, default=5, help="Simulated query time of the stub database")
+    parser.add_argument('--workers', type=int, help="gunicorn workers (default: WEB_WORKERS)")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the response cache of a --serve'd API")
+    parser.add_argument('--startup', type=float, default=15, help="Seconds to wait for a --serve'd API")
+    parser.add_argument('--json', action='store_true', help="Print the reports as JSON")
+    args = parser.parse_args()
+
+    server = None
+    if args.serve != 'none':
+        args.host = '127.0.0.1'
+        server = multiprocessing.Process(target=serve, args=(args,), daemon=True)
+        server.start()
+        if not wait_until_up(args.port, args.startup):
+            server.terminate()
+            sys.exit(f"❌ API did not come up on port {args.port}")
+
+    reports = []
+    try:
+        for path in args.paths or DEFAULT_PATHS:
+            reports.append(bench_path(args, path))
+    finally:
+        if server:
+            server.terminate()
+            server.join()
+
+    if args.json:
+        print(json.dumps(reports))
+        return
+    print(f"\n{'path':<28} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for r in reports:
+        p50 = f"{r['p50_ms']:.2f}" if r['p50_ms'] is not None else '-'
+        p99 = f"{r['p99_ms']:.2f}" if r['p99_ms'] is not None else '-'
+        print(f"{r['path']:<28} {r['rps']:>10.0f} {p50:>9} {p99:>9} {r['errors']:>7}")
+
+if __name__ == "__main__":
+    main()
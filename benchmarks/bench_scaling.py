@@ -0,0 +1,121 @@
+# benchmarks/bench_scaling.py
+# Measures ingestion throughput of server/launcher.py as the worker count grows.
+#
+#   cd benchmarks
+#   python bench_scaling.py --workers 1 2 4 8 --duration 10
+#
+# Workers persist into NullDatabase so the numbers reflect receive, decode and
+# scoring; per-packet logging is silenced.
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import time
+import sys
+sys.path.append('..')
+sys.path.append('../server')
+from utils.config import SERVER_HOST, SERVER_PORT, PROTOCOLS, SEND_WINDOW, RECV_BUFFER_SIZE
+from utils.protocol import FrameDecoder, encode_hello, encode_json_frame
+from ml.anomaly_model import AnomalyDetector
+from server import create_server
+from launcher import WorkerSupervisor
+from stubs import NullDatabase, scratch_registry
+
+# Loaded once in the parent and inherited by forked workers
+DETECTOR = None
+
+def quiet_server(reuse_port=False, metrics_port=None):
+    """Server factory for benchmark workers: stub DB, no per-packet output"""
+    sys.stdout = open(os.devnull, 'w')
+    server = create_server(db=NullDatabase(), ml_model=DETECTOR, reuse_port=reuse_port, metrics_port=metrics_port)
+    server.log_packet = lambda *args: None
+    return server
+
+def make_frames(count):
+    """Pre-encode a block of framed packets with ~10% anomalous sizes"""
+    frames = []
+    for i in range(count):
+        size = random.randint(64, 1500) if random.random() >= 0.1 else random.randint(5000, 10000)
+        frames.append(encode_json_frame({
+            'id': f"PKT-bench-{i}",
+            'source_ip': f"192.168.1.{random.randint(1, 254)}",
+            'dest_ip': f"10.0.0.{random.randint(1, 254)}",
+            'packet_size': size,
+            'protocol': random.choice(PROTOCOLS)
+        }))
+    return frames
+
+def blast(stop_at, block=256):
+    """Load process: send pre-encoded frames as fast as the ack window allows"""
+    frames = make_frames(block)
+    payload = b''.join(frames)
+    sock = socket.create_connection((SERVER_HOST, SERVER_PORT))
+    sock.sendall(encode_hello())
+    decoder = FrameDecoder()
+    sent = acked = 0
+
+    try:
+        while time.monotonic() < stop_at:
+            sock.sendall(payload)
+            sent += block
+            while sent - acked >= SEND_WINDOW:
+                data = sock.recv(RECV_BUFFER_SIZE)
+                if not data:
+                    return
+                for ack in decoder.feed(data):
+                    acked = max(acked, json.loads(ack)['seq'])
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+def measure(num_workers, connections, duration, warmup):
+    """Run one configuration and return packets/second processed by the workers"""
+    supervisor = WorkerSupervisor(num_workers, server_factory=quiet_server)
+    supervisor.start_workers()
+    time.sleep(2)  # Let every worker bind
+
+    stop_at = time.monotonic() + warmup + duration
+    loaders = [multiprocessing.Process(target=blast, args=(stop_at,)) for _ in range(connections)]
+    for loader in loaders:
+        loader.start()
+
+    time.sleep(warmup)
+    start_packets = supervisor.totals()['packets']
+    start = time.monotonic()
+    time.sleep(duration)
+    packets = supervisor.totals()['packets'] - start_packets
+    elapsed = time.monotonic() - start
+
+    for loader in loaders:
+        loader.join()
+    supervisor.shutdown()
+    return packets / elapsed
+
+def main():
+    global DETECTOR
+    parser = argparse.ArgumentParser(description="NetSentinel multi-process scaling benchmark")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--connections-per-worker', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    args = parser.parse_args()
+
+    DETECTOR = AnomalyDetector(registry=scratch_registry())
+    print(f"CPU cores: {os.cpu_count()}")
+
+    results = []
+    for num_workers in args.workers:
+        rate = measure(num_workers, num_workers * args.connections_per_worker, args.duration, args.warmup)
+        results.append((num_workers, rate))
+
+    baseline = results[0][1] / results[0][0] if results[0][1] else 0
+    print(f"\n{'workers':>8} {'pkt/s':>12} {'speedup':>8} {'efficiency':>11}")
+    for num_workers, rate in results:
+        speedup = rate / baseline if baseline else 0
+        print(f"{num_workers:>8} {rate:>12.0f} {speedup:>8.2f} {speedup / num_workers:>10.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# benchmarks/bench_suite.py
+# Regression benchmarks for the scoring, storage and ingest paths.
+#
+#   cd benchmarks
+#   python bench_suite.py                                   # everything, stub database
+#   python bench_suite.py --db postgres --output run.json   # against the configured PostgreSQL
+#   python bench_suite.py --baseline run.json               # exit 1 if anything regressed
+#
+# With --db postgres the storage and ingest benchmarks write real rows into the
+# packets table; point DB_CONFIG at a scratch database. Models are trained into
+# a temporary registry, never the one in MODEL_DIR.
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import subprocess
+import time
+import sys
+sys.path.append('..')
+sys.path.append('../server')
+sys.path.append('../client')
+from utils.config import PROTOCOLS, BATCH_MAX_SIZE, BASE_DIR, SERVER_HOST, SERVER_PORT
+from ml.anomaly_model import AnomalyDetector
+from ml.model_registry import ModelRegistry
+from stubs import NullDatabase, scratch_registry
+
+# Metrics where a smaller value is better; everything else is a rate
+LOWER_IS_BETTER = ('_ms',)
+
+def random_packets(count):
+    """(source_ip, dest_ip, packet_size, protocol) rows with ~10% anomalous sizes"""
+    rows = []
+    for _ in range(count):
+        size = random.randint(64, 1500) if random.random() >= 0.1 else random.randint(5000, 10000)
+        rows.append((f"192.168.1.{random.randint(1, 254)}", f"10.0.0.{random.randint(1, 254)}",
+                     size, random.choice(PROTOCOLS)))
+    return rows
+
+def rate(count, func):
+    """Run func once and return count / elapsed seconds"""
+    start = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - start)
+
+def make_database(kind):
+    """Stub or real database for the storage and ingest benchmarks"""
+    if kind == 'stub':
+        return NullDatabase()
+    from database.db import Database
+    return Database()
+
+def bench_predict(args):
+    """AnomalyDetector.predict (per packet) and predict_batch, for each inference backend"""
+    results = {}
+    rows = random_packets(args.packets)
+    sizes = [row[2] for row in rows]
+    protocols = [row[3] for row in rows]
+    sources = [row[0] for row in rows]
+    dests = [row[1] for row in rows]
+
+    for backend in ('compiled', 'sklearn'):
+        with contextlib.redirect_stdout(io.StringIO()):
+            detector = AnomalyDetector(backend=backend, registry=ModelRegistry(args.model_dir))
+        single = rows[:min(len(rows), 2000)]
+        results[f'predict_{backend}_pkt_s'] = rate(len(single), lambda: [
+            detector.predict(size, protocol, source, dest) for source, dest, size, protocol in single
+        ])
+
+        def batches():
+            for i in range(0, len(rows), BATCH_MAX_SIZE):
+                detector.predict_batch(sizes[i:i + BATCH_MAX_SIZE], protocols[i:i + BATCH_MAX_SIZE],
+                                       sources[i:i + BATCH_MAX_SIZE], dests[i:i + BATCH_MAX_SIZE])
+        results[f'predict_batch_{backend}_pkt_s'] = rate(len(rows), batches)
+    return results
+
+def bench_database(args):
+    """Single-row and bulk insert throughput"""
+    db = make_database(args.db)
+    rows = [row + (row[2] > 5000,) for row in random_packets(args.packets)]
+    single = rows[:min(len(rows), 2000)]
+    try:
+        return {
+            'insert_packet_rows_s': rate(len(single), lambda: [db.insert_packet(*row) for row in single]),
+            'insert_packets_rows_s': rate(len(rows), lambda: [
+                db.insert_packets(rows[i:i + BATCH_MAX_SIZE]) for i in range(0, len(rows), BATCH_MAX_SIZE)
+            ])
+        }
+    finally:
+        db.close()
+
+def serve(db_kind, model_dir):
+    """Ingest server process for the end-to-end benchmark"""
+    from server import create_server
+    sys.stdout = open(os.devnull, 'w')
+    server = create_server(db=make_database(db_kind), ml_model=AnomalyDetector(registry=ModelRegistry(model_dir)))
+    server.log_packet = lambda *args: None
+    server.start()
+
+def bench_ingest(args):
+    """Load generator against a real server process: throughput and ack latency"""
+    from loadgen import run_load, build_parser
+
+    server = multiprocessing.Process(target=serve, args=(args.db, args.model_dir), daemon=True)
+    server.start()
+    time.sleep(args.startup)
+    results = {}
+    try:
+        for mode in ('framed', 'binary'):
+            load_args = build_parser().parse_args([
+                '--connections', str(args.connections), '--duration', str(args.duration), '--mode', mode
+            ])
+            load_args.processes = 1
+            report = run_load(load_args)
+            results[f'ingest_{mode}_pkt_s'] = report['throughput']
+            for name in ('p50_ms', 'p99_ms', 'p999_ms'):
+                results[f'ingest_{mode}_{name}'] = report[name]
+    finally:
+        server.terminate()
+        server.join()
+    return results
+
+def fresh_import(module, directory):
+    """Seconds a new interpreter spends importing `module` from `directory`"""
+    code = (f"import time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start)")
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.join(BASE_DIR, directory),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+def time_to_ready(model_dir, timeout=30):
+    """Seconds from launching an ingest server (stub database) until it accepts a connection"""
+    code = ("import sys; sys.path[:0] = ['..', '../benchmarks']; from stubs import NullDatabase; "
+            "from ml.anomaly_model import AnomalyDetector; from ml.model_registry import ModelRegistry; "
+            "from server import create_server; "
+            f"model = AnomalyDetector(watch=True, background=True, registry=ModelRegistry({model_dir!r})); "
+            "create_server(db=NullDatabase(), ml_model=model, metrics_port=None).start()")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=os.path.join(BASE_DIR, 'server'),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {process.returncode}")
+            try:
+                socket.create_connection((SERVER_HOST, SERVER_PORT), timeout=0.1).close()
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError(f"Server not ready within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+def bench_startup(args):
+    """Import time of the ingest server and the API, and ingest time-to-ready (medians over fresh processes)"""
+    runs = 5
+    # Time a server loading a published model, as in production, not one bootstrapping the first
+    with contextlib.redirect_stdout(io.StringIO()):
+        AnomalyDetector(registry=ModelRegistry(args.model_dir))
+    return {
+        'import_server_ms': statistics.median(fresh_import('server', 'server') for _ in range(runs)) * 1000,
+        'import_app_ms': statistics.median(fresh_import('app', 'web') for _ in range(runs)) * 1000,
+        'server_ready_ms': statistics.median(time_to_ready(args.model_dir) for _ in range(runs)) * 1000
+    }
+
+BENCHMARKS = {'predict': bench_predict, 'db': bench_database, 'ingest': bench_ingest, 'startup': bench_startup}
+
+def compare(results, baseline, tolerance):
+    """Print results next to the baseline; returns the names of regressed metrics"""
+    regressions = []
+    print(f"\n{'metric':<34} {'value':>14} {'baseline':>14} {'change':>8}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        if value is None or not base:
+            shown = f"{value:.2f}" if value is not None else '-'
+            print(f"{name:<34} {shown:>14} {'-':>14}")
+            continue
+        change = value / base - 1
+        worse = change > tolerance if name.endswith(LOWER_IS_BETTER) else change < -tolerance
+        flag = ' ❌' if worse else ''
+        print(f"{name:<34} {value:>14.2f} {base:>14.2f} {change:>+8.0%}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="NetSentinel benchmark suite")
+    parser.add_argument('benchmarks', nargs='*', help=f"Subset to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--db', choices=('stub', 'postgres'), default='stub')
+    parser.add_argument('--packets', type=int, default=20000)
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--startup', type=float, default=3, help="Seconds to wait for the server to bind")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against a previous --output file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed fractional slowdown")
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark '{name}'")
+
+    random.seed(42)
+    args.model_dir = scratch_registry().directory
+    results = {}
+    for name in args.benchmarks or list(BENCHMARKS):
+        print(f"🚀 Running {name} benchmark...")
+        results.update(BENCHMARKS[name](args))
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
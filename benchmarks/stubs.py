@@ -0,0 +1,61 @@
+# benchmarks/stubs.py
+# In-memory stand-ins so benchmarks can run without PostgreSQL or the real model registry
+import atexit
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+import sys
+sys.path.append('..')
+from ml.model_registry import ModelRegistry
+
+def scratch_registry():
+    """ModelRegistry in a temporary directory, removed at exit, so benchmarks never publish to MODEL_DIR"""
+    directory = tempfile.mkdtemp(prefix='netsentinel-bench-models-')
+    atexit.register(shutil.rmtree, directory, True)
+    return ModelRegistry(directory)
+
+class NullDatabase:
+    """Accepts writes and counts them; reads return empty results or canned rows
+
+    `query_delay` (seconds) is slept on every read to stand in for a database round trip.
+    """
+
+    def __init__(self, *args, query_delay=0, **kwargs):
+        self.rows = 0
+        self.query_delay = query_delay
+        now = datetime.now()
+        self.sample = [
+            (1000 - i, f"192.168.1.{i % 254 + 1}", f"10.0.0.{i % 254 + 1}", 64 + i, 'TCP',
+             now - timedelta(seconds=i), i % 10 == 0, 1)
+            for i in range(1000)
+        ]
+
+    def insert_packet(self, source_ip, dest_ip, packet_size, protocol, anomaly_flag, model_version=None):
+        self.rows += 1
+        return True
+
+    def insert_packets(self, rows, model_version=None):
+        self.rows += len(rows)
+        return True
+
+    def publish_top(self, snapshot):
+        pass
+
+    def record_rate_limited(self, limited):
+        return True
+
+    def query_packets(self, limit=100, **filters):
+        time.sleep(self.query_delay)
+        return self.sample[:limit]
+
+    def get_stats(self):
+        time.sleep(self.query_delay)
+        return {'total': self.rows, 'anomalies': 0, 'bytes': 0, 'protocols': {}}
+
+    def get_timeseries(self, minutes=60, protocol=None):
+        time.sleep(self.query_delay)
+        return []
+
+    def close(self):
+        pass
@@ -5,14 +5,19 @@ import random
 import time
 import sys
 sys.path.append('..')
-from utils.config import SERVER_HOST, SERVER_PORT, PROTOCOLS
+from utils.config import SERVER_HOST, SERVER_PORT, PROTOCOLS, PROTOCOL_MODE, SEND_WINDOW, RECV_BUFFER_SIZE
+from utils.protocol import FrameDecoder, ENCODING_JSON, ENCODING_BINARY, encode_hello, encode_json_frame, encode_record
 
 class TrafficGenerator:
-    def __init__(self, client_id):
+    def __init__(self, client_id, mode=PROTOCOL_MODE):
         self.client_id = client_id
         self.host = SERVER_HOST
         self.port = SERVER_PORT
+        self.mode = mode
         self.socket = None
+        self.ack_decoder = None
+        self.sent = 0
+        self.acked = 0
 
     def generate_packet(self):
         """Generate random packet data"""
@@ -38,12 +43,42 @@ class TrafficGenerator:
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.host, self.port))
-            print(f"✅ Client {self.client_id} connected to {self.host}:{self.port}")
+            if self.mode in ('framed', 'binary'):
+                self.socket.sendall(encode_hello(ENCODING_BINARY if self.mode == 'binary' else ENCODING_JSON))
+                self.ack_decoder = FrameDecoder()
+                self.sent = 0
+                self.acked = 0
+            print(f"✅ Client {self.client_id} connected to {self.host}:{self.port} ({self.mode} mode)")
             return True
         except Exception as e:
             print(f"❌ Connection error: {e}")
             return False
 
+    def send_packet(self, packet):
+        """Send one packet; returns the ack in legacy mode, None in framed and binary modes"""
+        if self.mode == 'legacy':
+            self.socket.send(json.dumps(packet).encode('utf-8'))
+            response = self.socket.recv(1024).decode('utf-8')
+            return json.loads(response)
+
+        self.socket.sendall(encode_record(packet) if self.mode == 'binary' else encode_json_frame(packet))
+        self.sent += 1
+
+        # Only block on acks once the in-flight window is full
+        if self.sent - self.acked >= SEND_WINDOW:
+            self.wait_for_acks(self.sent - SEND_WINDOW + 1)
+        return None
+
+    def wait_for_acks(self, seq):
+        """Block until the server has acknowledged every frame up to `seq`"""
+        while self.acked < seq:
+            data = self.socket.recv(RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            for payload in self.ack_decoder.feed(data):
+                ack = json.loads(payload)
+                self.acked = max(self.acked, ack.get('seq', 0))
+
     def send_traffic(self, num_packets=10, delay=1):
         """Send multiple packets to the server"""
         if not self.connect():
@@ -53,16 +88,20 @@ class TrafficGenerator:
             for i in range(num_packets):
                 # Generate and send packet
                 packet = self.generate_packet()
-                self.socket.send(json.dumps(packet).encode('utf-8'))
+                response_data = self.send_packet(packet)
                 print(f"📤 Sent: {packet['id']} | {packet['packet_size']}B | {packet['protocol']}")
                 
-                # Receive acknowledgment
-                response = self.socket.recv(1024).decode('utf-8')
-                response_data = json.loads(response)
-                print(f"📥 Ack: {response_data['status']}")
+                # Legacy mode acknowledges every packet
+                if response_data:
+                    print(f"📥 Ack: {response_data['status']}")
                 
                 # Wait before sending next packet
                 time.sleep(delay)
+            
+            # Framed and binary modes acknowledge in batches; wait for the final watermark
+            if self.mode != 'legacy':
+                self.wait_for_acks(self.sent)
+                print(f"📥 Ack: {self.acked} packets received")
                 
         except KeyboardInterrupt:
             print(f"\n⏹️ Client {self.client_id} stopped by user")
@@ -81,13 +120,10 @@ class TrafficGenerator:
             packet_count = 0
             while True:
                 packet = self.generate_packet()
-                self.socket.send(json.dumps(packet).encode('utf-8'))
+                self.send_packet(packet)
                 packet_count += 1
                 print(f"📤 [{packet_count}] {packet['protocol']} | {packet['packet_size']}B")
                 
-                # Receive acknowledgment
-                response = self.socket.recv(1024).decode('utf-8')
-                
                 time.sleep(delay)
                 
         except KeyboardInterrupt:
@@ -101,8 +137,9 @@ class TrafficGenerator:
 if __name__ == "__main__":
     # Get client ID from command line or use default
     client_id = sys.argv[1] if len(sys.argv) > 1 else "1"
+    mode = sys.argv[2] if len(sys.argv) > 2 else PROTOCOL_MODE
     
-    client = TrafficGenerator(client_id)
+    client = TrafficGenerator(client_id, mode)
     
     print("\n🎯 Traffic Generator Menu:")
     print("1. Send fixed number of packets")
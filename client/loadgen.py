@@ -0,0 +1,244 @@
+# client/loadgen.py
+# Scriptable load generator: many concurrent connections, target or maximum
+# rate, configurable anomaly mix; reports throughput and ack latency.
+#
+#   cd client
+#   python loadgen.py --connections 32 --rate 20000 --duration 30 --mode binary
+#   python loadgen.py --connections 8 --open-loop --rate 50000 --mix normal=0.8,large=0.1,scan=0.1
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+from array import array
+from collections import deque
+import numpy as np
+import sys
+sys.path.append('..')
+from utils.config import SERVER_HOST, SERVER_PORT, PROTOCOLS, SEND_WINDOW
+from utils.protocol import (FrameDecoder, ENCODING_JSON, ENCODING_BINARY, encode_hello, encode_json_frame,
+                            encode_record)
+
+PACKET_KINDS = ('normal', 'small', 'large', 'scan', 'flood')
+DEFAULT_MIX = 'normal=0.9,small=0.05,large=0.05'
+POOL_SIZE = 4096  # Distinct pre-encoded packets cycled by each connection
+SEND_CHUNK = 64  # Packets written per send when running unthrottled
+TICK = 0.005  # Seconds between paced sends
+
+def parse_mix(text):
+    """'normal=0.9,large=0.1' -> {'normal': 0.9, 'large': 0.1}"""
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in PACKET_KINDS:
+            raise ValueError(f"Unknown packet kind '{kind}' (choose from {', '.join(PACKET_KINDS)})")
+        mix[kind] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise ValueError("Packet mix weights must sum to more than 0")
+    return mix
+
+def make_packet(kind, connection_id, i):
+    """One packet of the given kind; scans and floods come from a per-connection attacker"""
+    packet = {
+        'id': f"PKT-load{connection_id}-{i}",
+        'source_ip': f"192.168.{connection_id % 256}.{random.randint(1, 254)}",
+        'dest_ip': f"10.0.0.{random.randint(1, 254)}",
+        'packet_size': random.randint(64, 1500),
+        'protocol': random.choice(PROTOCOLS)
+    }
+    if kind == 'small':
+        packet['packet_size'] = random.randint(20, 50)
+    elif kind == 'large':
+        packet['packet_size'] = random.randint(5000, 10000)
+    elif kind == 'scan':
+        # One source walking through many destinations
+        packet['source_ip'] = f"172.16.{connection_id % 256}.66"
+        packet['dest_ip'] = f"10.{(i >> 8) & 255}.{i & 255}.1"
+    elif kind == 'flood':
+        # One source hammering one destination
+        packet['source_ip'] = f"172.16.{connection_id % 256}.99"
+        packet['dest_ip'] = "10.0.0.1"
+    return packet
+
+def make_pool(mode, mix, connection_id):
+    """Pre-encode POOL_SIZE packets drawn from the mix, so sending costs no encoding"""
+    kinds = random.choices(list(mix), weights=list(mix.values()), k=POOL_SIZE)
+    encode = encode_record if mode == 'binary' else encode_json_frame
+    return [encode(make_packet(kind, connection_id, i)) for i, kind in enumerate(kinds)]
+
+class Connection:
+    """One load connection: sends on schedule or as fast as the ack window allows"""
+
+    def __init__(self, connection_id, mode, mix, rate, open_loop, latencies):
+        self.pool = make_pool(mode, mix, connection_id)
+        self.mode = mode
+        self.rate = rate
+        self.open_loop = open_loop
+        self.latencies = latencies
+        self.sent = 0
+        self.acked = 0
+        # Intended send time of every unacknowledged packet, oldest first
+        self.in_flight = deque()
+        self.window_open = asyncio.Event()
+        self.window_open.set()
+
+    async def run(self, host, port, stop_at):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(encode_hello(ENCODING_BINARY if self.mode == 'binary' else ENCODING_JSON))
+        receiver = asyncio.create_task(self.receive(reader))
+        try:
+            await self.send(writer, stop_at)
+            # Give the last packets a moment to be acknowledged
+            drain_until = time.monotonic() + 2
+            while self.acked < self.sent and time.monotonic() < drain_until:
+                await asyncio.sleep(0.01)
+        finally:
+            receiver.cancel()
+            writer.close()
+
+    async def send(self, writer, stop_at):
+        """Paced mode sends what is due every TICK; unthrottled mode sends SEND_CHUNK at a time"""
+        start = time.monotonic()
+        pool, size = self.pool, len(self.pool)
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                return
+            if self.rate:
+                due = int((now - start) * self.rate) - self.sent
+                # Open loop keeps the schedule even when the server falls behind
+                interval = 1.0 / self.rate
+                intended = [start + (self.sent + k) * interval for k in range(due)]
+            else:
+                due = SEND_CHUNK
+                intended = [now] * due
+
+            if not self.open_loop:
+                window = SEND_WINDOW - (self.sent - self.acked)
+                due = min(due, window)
+                if window <= 0:
+                    self.window_open.clear()
+                    try:
+                        await asyncio.wait_for(self.window_open.wait(), timeout=stop_at - now)
+                    except asyncio.TimeoutError:
+                        return
+                    continue
+
+            if due > 0:
+                first = self.sent % size
+                chunk = [pool[(first + k) % size] for k in range(due)]
+                self.in_flight.extend(intended[:due])
+                self.sent += due
+                writer.write(b''.join(chunk))
+                await writer.drain()
+
+            if self.rate:
+                await asyncio.sleep(TICK)
+            else:
+                await asyncio.sleep(0)
+
+    async def receive(self, reader):
+        """Match watermark acks to send times and record latencies"""
+        decoder = FrameDecoder()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            now = time.monotonic()
+            for payload in decoder.feed(data):
+                seq = json.loads(payload).get('seq', 0)
+                while self.acked < seq and self.in_flight:
+                    self.latencies.append(now - self.in_flight.popleft())
+                    self.acked += 1
+            self.window_open.set()
+
+async def run_connections(args, process_index):
+    """Run this process's share of the connections; returns (sent, acked, latencies)"""
+    latencies = array('d')
+    per_process = args.connections // args.processes + (process_index < args.connections % args.processes)
+    rate = args.rate / args.connections if args.rate else 0
+    stop_at = time.monotonic() + args.duration
+    connections = [
+        Connection(process_index * 10000 + i, args.mode, args.mix, rate, args.open_loop, latencies)
+        for i in range(per_process)
+    ]
+    results = await asyncio.gather(
+        *(c.run(args.host, args.port, stop_at) for c in connections), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"⚠️ Connection failed: {result}")
+    return sum(c.sent for c in connections), sum(c.acked for c in connections), latencies
+
+def run_process(args, process_index, results):
+    """Entry point of one load process"""
+    sent, acked, latencies = asyncio.run(run_connections(args, process_index))
+    results.put((sent, acked, latencies.tobytes()))
+
+def run_load(args):
+    """Run the load across args.processes processes and return the aggregate report"""
+    start = time.monotonic()
+    if args.processes == 1:
+        sent, acked, latencies = asyncio.run(run_connections(args, 0))
+        latencies = np.frombuffer(latencies, dtype=np.float64) if len(latencies) else np.zeros(0)
+    else:
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_process, args=(args, i, results))
+                     for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        parts = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        sent = sum(part[0] for part in parts)
+        acked = sum(part[1] for part in parts)
+        latencies = np.concatenate([np.frombuffer(part[2], dtype=np.float64) for part in parts])
+    elapsed = time.monotonic() - start
+    return summarize(sent, acked, latencies, min(elapsed, args.duration))
+
+def summarize(sent, acked, latencies, duration):
+    """Throughput and ack latency percentiles (milliseconds)"""
+    report = {
+        'sent': sent,
+        'acked': acked,
+        'duration': duration,
+        'throughput': acked / duration if duration else 0
+    }
+    for name, q in (('p50_ms', 50), ('p99_ms', 99), ('p999_ms', 99.9), ('max_ms', 100)):
+        report[name] = float(np.percentile(latencies, q) * 1000) if len(latencies) else None
+    return report
+
+def print_report(report):
+    """Human-readable summary"""
+    print(f"📊 Sent {report['sent']} | acked {report['acked']} | {report['throughput']:.0f} pkt/s "
+          f"over {report['duration']:.1f}s")
+    if report['p50_ms'] is not None:
+        print(f"⏱️ Ack latency p50 {report['p50_ms']:.2f} ms | p99 {report['p99_ms']:.2f} ms | "
+              f"p999 {report['p999_ms']:.2f} ms | max {report['max_ms']:.2f} ms")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="NetSentinel load generator")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=1, help="Load processes sharing the connections")
+    parser.add_argument('--rate', type=float, default=0, help="Total packets/s across connections (0 = as fast as acks allow)")
+    parser.add_argument('--open-loop', action='store_true', help="Send on schedule regardless of outstanding acks")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--mode', choices=('framed', 'binary'), default='framed')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Packet kinds and weights, e.g. {DEFAULT_MIX},scan=0.01,flood=0.01")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.open_loop and not args.rate:
+        sys.exit("--open-loop needs --rate")
+    args.processes = max(1, min(args.processes, args.connections))
+    report = run_load(args)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
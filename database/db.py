@@ -1,127 +1,1030 @@
 # database/db.py
 import psycopg2
-from psycopg2 import pool
-from datetime import datetime
+from psycopg2.extras import execute_values
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import io
+import json
+import queue
+import threading
+import time
 import sys
 sys.path.append('..')
-from utils.config import DB_CONFIG
+from utils.config import (DB_CONFIG, WRITE_BUFFER_MAX_ROWS, WRITE_BUFFER_FLUSH_ROWS,
+                          WRITE_BUFFER_FLUSH_MS, WRITE_BUFFER_PUT_TIMEOUT,
+                          LIVE_FEED, LIVE_FEED_CHANNEL, LIVE_FEED_MAX_PACKETS,
+                          PARTITION_INTERVAL, PARTITION_PREMAKE, RETENTION_DAYS,
+                          PARTITION_MAINTENANCE_INTERVAL, PARTITION_LOCK_TIMEOUT_MS, TRAIN_CHUNK_SIZE,
+                          DB_POOL_SIZE, EXPORT_CHUNK_SIZE, STATS_TOTAL_SHARDS)
+from utils import metrics
+from database.pool import ConnectionPool
+
+PACKET_COLUMNS = "(source_ip, dest_ip, packet_size, protocol, anomaly_flag, timestamp, model_version)"
+
+PARTITION_STEPS = {'day': timedelta(days=1), 'hour': timedelta(hours=1)}
+PARTITION_NAME_FORMATS = {'day': '%Y%m%d', 'hour': '%Y%m%d%H'}
+MAINTENANCE_LOCK_ID = 7423001  # pg advisory lock so only one process maintains partitions at a time
+RESCORE_LOCK_ID = 7423002  # pg advisory lock so only one rescoring job runs at a time
+
+NOTIFY_PAYLOAD_LIMIT = 7900  # PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+
+_STOP = object()
+
+write_seconds = metrics.histogram('netsentinel_db_write_seconds', 'Time per database write call', ['method'])
+rows_written = metrics.counter('netsentinel_db_rows_written_total', 'Packet rows committed to the database')
+write_buffer_depth = metrics.gauge('netsentinel_queue_depth', 'Items waiting in an internal queue', ['queue'])
+write_buffer_dropped = metrics.counter('netsentinel_write_buffer_dropped_total', 'Rows dropped because the write buffer was full')
+COPY_SECONDS = write_seconds.labels('copy')
+INSERT_SECONDS = write_seconds.labels('insert')
+
+def notify_delta(cursor, message):
+    """NOTIFY live listeners of a JSON stats payload, tagged with this transaction's txid (delivered on commit)"""
+    # The txid lets a listener skip deltas already counted in the totals it started from
+    cursor.execute("""SELECT pg_notify(%s, '{"txid": ' || txid_current() || ', ' || substr(%s, 2))""",
+                   (LIVE_FEED_CHANNEL, message))
+
+def parse_snapshot(text):
+    """(xmin, xmax, in-progress txids) from txid_current_snapshot() text"""
+    xmin, xmax, active = text.split(':')
+    return int(xmin), int(xmax), frozenset(int(txid) for txid in active.split(',') if txid)
+
+def _copy_field(value):
+    """Render one value in COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, int):
+        return str(value)
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def partition_start(moment, interval=PARTITION_INTERVAL):
+    """Start of the partition that holds `moment`"""
+    if interval == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def partition_name(start, interval=PARTITION_INTERVAL):
+    """Table name of the partition starting at `start`, e.g. packets_p20261018"""
+    return f"packets_p{start.strftime(PARTITION_NAME_FORMATS[interval])}"
+
+def aggregate_rollups(rows):
+    """Sum timestamped packet rows into (minute, protocol, packets, anomalies, bytes)"""
+    buckets = {}
+    for source_ip, dest_ip, packet_size, protocol, anomaly_flag, timestamp, model_version in rows:
+        key = (timestamp.replace(second=0, microsecond=0), protocol)
+        totals = buckets.get(key)
+        if totals is None:
+            totals = buckets[key] = [0, 0, 0]
+        totals[0] += 1
+        totals[1] += bool(anomaly_flag)
+        totals[2] += packet_size
+    # Sorted so concurrent writers take row locks in the same order
+    return [(bucket, protocol, *totals) for (bucket, protocol), totals in sorted(buckets.items())]
+
+class WriteBehindBuffer:
+    """Accumulate packet rows and flush them to the database in bulk
+
+    Rows are flushed once `flush_rows` are buffered or `flush_ms` have passed
+    since the first buffered row. When `max_rows` are waiting, writers block
+    for up to `put_timeout` seconds (forever if None) before the row is dropped.
+    """
+
+    def __init__(self, db, max_rows=WRITE_BUFFER_MAX_ROWS, flush_rows=WRITE_BUFFER_FLUSH_ROWS,
+                 flush_ms=WRITE_BUFFER_FLUSH_MS, put_timeout=WRITE_BUFFER_PUT_TIMEOUT):
+        self.db = db
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_ms / 1000.0
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max_rows)
+        self.dropped = 0
+        write_buffer_depth.labels('write_buffer').set_function(self.queue.qsize)
+        self.thread = threading.Thread(target=self.run, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def put(self, row):
+        """Buffer a row, blocking while the buffer is full"""
+        try:
+            self.queue.put(row, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            write_buffer_dropped.inc()
+            return False
+
+    def run(self):
+        """Flush loop: block for the first row, then fill until size or deadline"""
+        stopping = False
+        while not stopping:
+            row = self.queue.get()
+            if row is _STOP:
+                break
+
+            rows = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    row = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                rows.append(row)
+
+            try:
+                self.db.copy_packets(rows)
+            except Exception as e:
+                print(f"❌ Error flushing {len(rows)} buffered rows: {e}")
+
+    def close(self):
+        """Flush every buffered row, then stop the flush thread"""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+        if self.dropped:
+            print(f"⚠️ Write buffer dropped {self.dropped} rows while full")
 
 class Database:
-    def __init__(self):
+    def __init__(self, write_behind=False, maintenance=False, pool_size=4):
+        """`pool_size` should cover the threads that query at once; DB_POOL_SIZE overrides it"""
+        self.write_buffer = None
+        self.partitioned = False
         try:
-            self.connection_pool = psycopg2.pool.SimpleConnectionPool(1, 20, **DB_CONFIG)
+            self.connection_pool = ConnectionPool(1, DB_POOL_SIZE or pool_size, **DB_CONFIG)
             if self.connection_pool:
                 print("✅ Database connection pool created successfully")
                 self.create_table()
+                if write_behind:
+                    self.write_buffer = WriteBehindBuffer(self)
+                if maintenance and self.partitioned:
+                    threading.Thread(target=self.maintenance_loop, name='partition-maintenance', daemon=True).start()
         except Exception as e:
             print(f"❌ Error creating connection pool: {e}")
             self.connection_pool = None
 
+    def connection(self):
+        """Check out a pooled connection for a with block"""
+        return self.connection_pool.connection()
+
     def create_table(self):
         """Create packets table if it doesn't exist"""
         try:
-            conn = self.connection_pool.getconn()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS packets (
-                    id SERIAL PRIMARY KEY,
-                    source_ip VARCHAR(15) NOT NULL,
-                    dest_ip VARCHAR(15) NOT NULL,
-                    packet_size INTEGER NOT NULL,
-                    protocol VARCHAR(10) NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    anomaly_flag BOOLEAN DEFAULT FALSE
-                )
-            """)
-            
-            conn.commit()
-            cursor.close()
-            self.connection_pool.putconn(conn)
+            with self.connection() as conn:
+                cursor = conn.cursor()
+
+                # Range-partitioned by timestamp; the partition key must be part of the primary key
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS packets (
+                        id BIGSERIAL,
+                        source_ip VARCHAR(15) NOT NULL,
+                        dest_ip VARCHAR(15) NOT NULL,
+                        packet_size INTEGER NOT NULL,
+                        protocol VARCHAR(10) NOT NULL,
+                        timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        anomaly_flag BOOLEAN DEFAULT FALSE,
+                        PRIMARY KEY (timestamp, id)
+                    ) PARTITION BY RANGE (timestamp)
+                """)
+
+                cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'packets'::regclass")
+                self.partitioned = cursor.fetchone()[0]
+                if self.partitioned:
+                    # Catches rows outside every range partition (e.g. clock skew) instead of failing the batch
+                    cursor.execute("CREATE TABLE IF NOT EXISTS packets_default PARTITION OF packets DEFAULT")
+                else:
+                    print("⚠️ Table 'packets' predates partitioning; partition maintenance and retention are disabled")
+
+                # Every index ends in (timestamp DESC, id DESC) to serve keyset pagination;
+                # on the partitioned table the (timestamp, id) primary key already covers it
+                if not self.partitioned:
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_packets_timestamp_id
+                            ON packets (timestamp DESC, id DESC)
+                    """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_packets_protocol_timestamp
+                        ON packets (protocol, timestamp DESC, id DESC)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_packets_anomalies
+                        ON packets (timestamp DESC, id DESC) WHERE anomaly_flag = TRUE
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_packets_source_timestamp
+                        ON packets (source_ip, timestamp DESC, id DESC)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_packets_dest_timestamp
+                        ON packets (dest_ip, timestamp DESC, id DESC)
+                """)
+
+                # Version of the model whose verdict anomaly_flag holds (NULL: unknown, pre-versioning)
+                cursor.execute("ALTER TABLE packets ADD COLUMN IF NOT EXISTS model_version INTEGER")
+
+                # Per-minute rollups and running totals maintained by ingestion
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS packet_stats_minute (
+                        bucket TIMESTAMP NOT NULL,
+                        protocol VARCHAR(10) NOT NULL,
+                        packets BIGINT NOT NULL DEFAULT 0,
+                        anomalies BIGINT NOT NULL DEFAULT 0,
+                        bytes BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (bucket, protocol)
+                    )
+                """)
+                # Totals are split into shards by connection; readers add the shards up
+                cursor.execute("""
+                    SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                                   WHERE table_schema = current_schema() AND table_name = 'packet_stats_total')
+                       AND NOT EXISTS (SELECT 1 FROM information_schema.columns
+                                       WHERE table_schema = current_schema() AND table_name = 'packet_stats_total'
+                                         AND column_name = 'shard')
+                """)
+                if cursor.fetchone()[0]:
+                    # One row per protocol from an older version: those rows become shard 0
+                    cursor.execute("ALTER TABLE packet_stats_total ADD COLUMN shard SMALLINT NOT NULL DEFAULT 0")
+                    cursor.execute("""
+                        ALTER TABLE packet_stats_total
+                            DROP CONSTRAINT packet_stats_total_pkey,
+                            ADD PRIMARY KEY (protocol, shard)
+                    """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS packet_stats_total (
+                        protocol VARCHAR(10) NOT NULL,
+                        shard SMALLINT NOT NULL DEFAULT 0,
+                        packets BIGINT NOT NULL DEFAULT 0,
+                        anomalies BIGINT NOT NULL DEFAULT 0,
+                        bytes BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (protocol, shard)
+                    )
+                """)
+
+                # Progress of historical rescoring jobs, one row per target model version
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS rescore_checkpoints (
+                        model_version INTEGER PRIMARY KEY,
+                        last_timestamp TIMESTAMP,
+                        last_id BIGINT,
+                        upper_timestamp TIMESTAMP NOT NULL,
+                        rows_scored BIGINT NOT NULL DEFAULT 0,
+                        rows_changed BIGINT NOT NULL DEFAULT 0,
+                        status VARCHAR(16) NOT NULL,
+                        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # Packets shed by per-source rate limits, summarized per minute instead of stored
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS rate_limited (
+                        bucket TIMESTAMP NOT NULL,
+                        source_ip VARCHAR(15) NOT NULL,
+                        packets BIGINT NOT NULL DEFAULT 0,
+                        bytes BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (bucket, source_ip)
+                    )
+                """)
+
+                conn.commit()
+
+                if self.partitioned:
+                    self.ensure_partitions(cursor)
+
+                # Backfill rollups once for tables that predate them
+                cursor.execute("""
+                    SELECT NOT EXISTS (SELECT 1 FROM packet_stats_total)
+                       AND EXISTS (SELECT 1 FROM packets)
+                """)
+                needs_backfill = cursor.fetchone()[0]
+                cursor.close()
             print("✅ Table 'packets' ready")
+
+            if needs_backfill:
+                self.rebuild_stats()
         except Exception as e:
             print(f"❌ Error creating table: {e}")
 
-    def insert_packet(self, source_ip, dest_ip, packet_size, protocol, anomaly_flag):
+    def ensure_partitions(self, cursor, premake=PARTITION_PREMAKE):
+        """Create the current partition and the next `premake` ones"""
+        step = PARTITION_STEPS[PARTITION_INTERVAL]
+        start = partition_start(datetime.now())
+        for _ in range(premake + 1):
+            name = partition_name(start)
+            try:
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {name} PARTITION OF packets
+                    FOR VALUES FROM (%s) TO (%s)
+                """, (start, start + step))
+                cursor.connection.commit()
+            except Exception as e:
+                # Typically rows for this range already landed in packets_default
+                cursor.connection.rollback()
+                print(f"⚠️ Could not create partition {name}: {e}")
+            start += step
+
+    def drop_expired_partitions(self, cursor, retention_days=RETENTION_DAYS):
+        """Drop whole partitions older than the retention window; returns their names
+
+        Each partition is first detached in a transaction of its own that
+        waits at most PARTITION_LOCK_TIMEOUT_MS for the packets lock, so
+        inserts queue behind it only for the catalog change. The detached
+        table's rows then leave the rollups in the transaction that drops it.
+        A table left detached by an interrupted run is dropped on the next one.
+        """
+        if retention_days is None:
+            return []
+        step = PARTITION_STEPS[PARTITION_INTERVAL]
+        cutoff = partition_start(datetime.now() - timedelta(days=retention_days))
+
+        # Stray rows in the default partition go first, so the minute rows of a
+        # dropped range hold only that partition's packets
+        self.expire_default_rows(cursor, cutoff)
+
+        cursor.execute("""
+            SELECT c.relname, i.inhrelid IS NOT NULL
+            FROM pg_class c
+            LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'packets'::regclass
+            WHERE c.relkind = 'r' AND c.relname LIKE 'packets\\_p%' AND pg_table_is_visible(c.oid)
+        """)
+        dropped = []
+        for name, attached in cursor.fetchall():
+            try:
+                start = datetime.strptime(name[len('packets_p'):], PARTITION_NAME_FORMATS[PARTITION_INTERVAL])
+            except ValueError:
+                continue
+            if start + step > cutoff:
+                continue
+
+            if attached:
+                # DETACH ... CONCURRENTLY is not allowed next to a default partition
+                try:
+                    cursor.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT_MS,))
+                    cursor.execute(f"ALTER TABLE packets DETACH PARTITION {name}")
+                    cursor.connection.commit()
+                except psycopg2.OperationalError as e:
+                    cursor.connection.rollback()
+                    print(f"⚠️ Could not detach partition {name}, retrying next run: {e}")
+                    continue
+
+            # Remove the range from the rollups too, so totals keep matching the table
+            cursor.execute("""
+                WITH expired AS (
+                    DELETE FROM packet_stats_minute
+                    WHERE bucket >= %s AND bucket < %s
+                    RETURNING protocol, packets, anomalies, bytes
+                )
+                SELECT protocol, SUM(packets)::bigint, SUM(anomalies)::bigint, SUM(bytes)::bigint
+                FROM expired GROUP BY protocol
+            """, (start, start + step))
+            self.adjust_totals(cursor, {
+                protocol: [-packets, -anomalies, -size] for protocol, packets, anomalies, size in cursor.fetchall()
+            })
+            cursor.execute(f"DROP TABLE {name}")
+            cursor.connection.commit()
+            dropped.append(name)
+        return dropped
+
+    def expire_default_rows(self, cursor, cutoff):
+        """Delete default-partition rows and rate-limit summaries older than `cutoff`, rollups included"""
+        # Stray rows that fell into the default partition are few; delete them row-wise
+        cursor.execute("""
+            WITH expired AS (
+                DELETE FROM packets_default
+                WHERE timestamp < %s
+                RETURNING timestamp, protocol, anomaly_flag, packet_size
+            )
+            SELECT date_trunc('minute', timestamp) AS bucket, protocol,
+                   COUNT(*), COUNT(*) FILTER (WHERE anomaly_flag), SUM(packet_size)::bigint
+            FROM expired
+            GROUP BY bucket, protocol
+            ORDER BY bucket, protocol
+        """, (cutoff,))
+        self.adjust_rollups(cursor, [
+            (bucket, protocol, -packets, -anomalies, -size)
+            for bucket, protocol, packets, anomalies, size in cursor.fetchall()
+        ])
+        cursor.execute("DELETE FROM packet_stats_minute WHERE bucket < %s AND packets <= 0", (cutoff,))
+        cursor.execute("DELETE FROM rate_limited WHERE bucket < %s", (cutoff,))
+        cursor.connection.commit()
+
+    def run_partition_maintenance(self):
+        """Pre-create upcoming partitions and apply retention (one process at a time)"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", (MAINTENANCE_LOCK_ID,))
+                if cursor.fetchone()[0]:
+                    try:
+                        self.ensure_partitions(cursor)
+                        dropped = self.drop_expired_partitions(cursor)
+                        if dropped:
+                            print(f"🗑️ Dropped expired partitions: {', '.join(dropped)}")
+                    finally:
+                        conn.rollback()
+                        cursor.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_ID,))
+                        conn.commit()
+
+                cursor.close()
+            return True
+        except Exception as e:
+            print(f"❌ Error maintaining partitions: {e}")
+            return False
+
+    def maintenance_loop(self):
+        """Run partition maintenance every PARTITION_MAINTENANCE_INTERVAL seconds"""
+        while self.connection_pool:
+            self.run_partition_maintenance()
+            time.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+    def insert_packet(self, source_ip, dest_ip, packet_size, protocol, anomaly_flag, model_version=None):
         """Insert a packet into the database"""
+        row = (source_ip, dest_ip, packet_size, protocol, anomaly_flag, datetime.now(), model_version)
+        if self.write_buffer:
+            return self.write_buffer.put(row)
+
+        try:
+            with self.connection() as conn:
+                stored = self.insert_rows(conn, [row])
+            return stored == 1
+        except Exception as e:
+            print(f"❌ Error inserting packet: {e}")
+            return False
+
+    def insert_packets(self, rows, model_version=None):
+        """Insert many (source_ip, dest_ip, packet_size, protocol, anomaly_flag) rows scored by `model_version`"""
+        now = datetime.now()
+        if self.write_buffer:
+            stored = 0
+            for row in rows:
+                stored += self.write_buffer.put((*row, now, model_version))
+            return stored == len(rows)
+
+        return self.copy_packets([(*row, now, model_version) for row in rows]) == len(rows)
+
+    def copy_packets(self, rows):
+        """Bulk load timestamped rows with COPY; returns the number stored"""
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                try:
+                    cursor = conn.cursor()
+
+                    data = io.StringIO()
+                    data.writelines('\t'.join(_copy_field(value) for value in row) + '\n' for row in rows)
+                    data.seek(0)
+                    cursor.copy_expert(f"COPY packets {PACKET_COLUMNS} FROM STDIN", data)
+                    self.publish_rows(cursor, rows)
+
+                    conn.commit()
+                    cursor.close()
+                    COPY_SECONDS.observe(time.perf_counter() - start)
+                    rows_written.inc(len(rows))
+                    return len(rows)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    raise
+                except Exception as e:
+                    # One bad row fails the whole COPY; retry row by row to keep the rest
+                    print(f"⚠️ Bulk insert of {len(rows)} rows failed ({e}), retrying row by row")
+                    conn.rollback()
+                    return self.insert_rows(conn, rows)
+        except Exception as e:
+            print(f"❌ Error bulk inserting {len(rows)} rows: {e}")
+            return 0
+
+    def insert_rows(self, conn, rows):
+        """Insert timestamped rows one at a time, skipping rows that fail"""
+        stored = 0
+        cursor = conn.cursor()
+        for row in rows:
+            try:
+                with INSERT_SECONDS.time():
+                    cursor.execute(f"INSERT INTO packets {PACKET_COLUMNS} VALUES (%s, %s, %s, %s, %s, %s, %s)", row)
+                    self.publish_rows(cursor, [row])
+                    conn.commit()
+                rows_written.inc()
+                stored += 1
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Error inserting packet: {e}")
+        cursor.close()
+        return stored
+
+    def publish_rows(self, cursor, rows):
+        """Update rollups and notify live listeners for rows written in this transaction"""
+        protocols = self.update_rollups(cursor, rows)
+        if LIVE_FEED:
+            self.notify_live(cursor, rows, protocols)
+
+    def update_rollups(self, cursor, rows):
+        """Add timestamped rows to the minute rollups and this connection's totals shard (caller commits)"""
+        minutes = aggregate_rollups(rows)
+
+        protocols = {}
+        for bucket, protocol, packets, anomalies, size in minutes:
+            totals = protocols.setdefault(protocol, [0, 0, 0])
+            totals[0] += packets
+            totals[1] += anomalies
+            totals[2] += size
+
+        execute_values(cursor, """
+            INSERT INTO packet_stats_minute (bucket, protocol, packets, anomalies, bytes)
+            VALUES %s
+            ON CONFLICT (bucket, protocol) DO UPDATE SET
+                packets = packet_stats_minute.packets + EXCLUDED.packets,
+                anomalies = packet_stats_minute.anomalies + EXCLUDED.anomalies,
+                bytes = packet_stats_minute.bytes + EXCLUDED.bytes
+        """, minutes)
+        self.add_totals(cursor, protocols)
+        return protocols
+
+    def add_totals(self, cursor, protocols):
+        """Add {protocol: [packets, anomalies, bytes]} to this connection's totals shard (caller commits)
+
+        Each connection writes one shard, so concurrent ingest transactions do
+        not all queue on the same few rows; get_stats adds the shards up.
+        """
+        execute_values(cursor, """
+            INSERT INTO packet_stats_total (protocol, shard, packets, anomalies, bytes)
+            VALUES %s
+            ON CONFLICT (protocol, shard) DO UPDATE SET
+                packets = packet_stats_total.packets + EXCLUDED.packets,
+                anomalies = packet_stats_total.anomalies + EXCLUDED.anomalies,
+                bytes = packet_stats_total.bytes + EXCLUDED.bytes
+        """, [(protocol, *totals) for protocol, totals in sorted(protocols.items())],
+            template=f"(%s, pg_backend_pid() %% {STATS_TOTAL_SHARDS}, %s::bigint, %s::bigint, %s::bigint)")
+
+    def notify_live(self, cursor, rows, protocols):
+        """Send the newest rows and the stats delta to LISTENers; delivered on commit"""
+        recent = rows[-LIVE_FEED_MAX_PACKETS:]
+        payload = {
+            'packets': [{
+                'source_ip': source_ip,
+                'dest_ip': dest_ip,
+                'packet_size': packet_size,
+                'protocol': protocol,
+                'timestamp': timestamp.isoformat(),
+                'anomaly_flag': anomaly_flag
+            } for source_ip, dest_ip, packet_size, protocol, anomaly_flag, timestamp, _ in reversed(recent)],
+            'delta': {
+                'total': len(rows),
+                'anomalies': sum(totals[1] for totals in protocols.values()),
+                'bytes': sum(totals[2] for totals in protocols.values()),
+                'protocols': {
+                    protocol: {'total': totals[0], 'anomalies': totals[1], 'bytes': totals[2]}
+                    for protocol, totals in protocols.items()
+                }
+            }
+        }
+        message = json.dumps(payload)
+        if len(message) > NOTIFY_PAYLOAD_LIMIT:
+            # Oversized payloads would fail the whole transaction; send totals only
+            payload['packets'] = []
+            payload['delta'].pop('protocols')
+            message = json.dumps(payload)
+        notify_delta(cursor, message)
+
+    def record_rate_limited(self, limited):
+        """Add {source_ip: [packets, bytes]} shed by rate limits to the current minute's summaries"""
+        bucket = datetime.now().replace(second=0, microsecond=0)
         try:
-            conn = self.connection_pool.getconn()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                execute_values(cursor, """
+                    INSERT INTO rate_limited (bucket, source_ip, packets, bytes)
+                    VALUES %s
+                    ON CONFLICT (bucket, source_ip) DO UPDATE SET
+                        packets = rate_limited.packets + EXCLUDED.packets,
+                        bytes = rate_limited.bytes + EXCLUDED.bytes
+                """, [(bucket, source_ip, packets, size) for source_ip, (packets, size) in sorted(limited.items())])
+                conn.commit()
+                cursor.close()
+            return True
+        except Exception as e:
+            print(f"❌ Error recording rate-limited traffic: {e}")
+            return False
+
+    def publish_top(self, snapshot):
+        """Send a top-talker snapshot to LISTENers (the API serves it from memory at /api/top)"""
+        payload = {'top': snapshot}
+        message = json.dumps(payload)
+        while len(message) > NOTIFY_PAYLOAD_LIMIT and (snapshot['sources'] or snapshot['pairs']):
+            # Keep the heaviest entries that fit
+            snapshot['sources'] = snapshot['sources'][:len(snapshot['sources']) // 2]
+            snapshot['pairs'] = snapshot['pairs'][:len(snapshot['pairs']) // 2]
+            message = json.dumps(payload)
+        with self.connection() as conn:
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO packets (source_ip, dest_ip, packet_size, protocol, anomaly_flag)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (source_ip, dest_ip, packet_size, protocol, anomaly_flag))
-            
+            cursor.execute("SELECT pg_notify(%s, %s)", (LIVE_FEED_CHANNEL, message))
             conn.commit()
             cursor.close()
-            self.connection_pool.putconn(conn)
+
+    def listen(self, channel):
+        """Open a dedicated autocommit connection LISTENing on `channel`"""
+        conn = psycopg2.connect(**DB_CONFIG)
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {channel}")
+        cursor.close()
+        return conn
+
+    def rebuild_stats(self):
+        """Recompute rollups and totals from the packets table (one full scan)"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute("TRUNCATE packet_stats_minute, packet_stats_total")
+                cursor.execute("""
+                    INSERT INTO packet_stats_minute (bucket, protocol, packets, anomalies, bytes)
+                    SELECT date_trunc('minute', timestamp), protocol, COUNT(*),
+                           COUNT(*) FILTER (WHERE anomaly_flag), COALESCE(SUM(packet_size), 0)
+                    FROM packets
+                    WHERE timestamp IS NOT NULL
+                    GROUP BY 1, 2
+                """)
+                cursor.execute("""
+                    INSERT INTO packet_stats_total (protocol, shard, packets, anomalies, bytes)
+                    SELECT protocol, 0, SUM(packets), SUM(anomalies), SUM(bytes)
+                    FROM packet_stats_minute
+                    GROUP BY protocol
+                """)
+
+                conn.commit()
+                cursor.close()
+            print("✅ Packet statistics rebuilt")
             return True
         except Exception as e:
-            print(f"❌ Error inserting packet: {e}")
+            print(f"❌ Error rebuilding stats: {e}")
             return False
 
-    def get_all_packets(self, limit=100):
-        """Retrieve all packets from database"""
-        try:
-            conn = self.connection_pool.getconn()
+    def query_packets(self, protocol=None, anomaly=None, source_ip=None, dest_ip=None,
+                      min_size=None, max_size=None, since=None, until=None, after=None, limit=100):
+        """Filter packets newest first; `after` is the (timestamp, id) of the last row already seen. Raises on database errors."""
+        conditions = []
+        params = []
+
+        if protocol:
+            conditions.append("protocol = %s")
+            params.append(protocol)
+        if anomaly is not None:
+            # Literal TRUE lets the planner use the partial anomaly index
+            conditions.append("anomaly_flag = TRUE" if anomaly else "anomaly_flag = FALSE")
+        if source_ip:
+            conditions.append("source_ip = %s")
+            params.append(source_ip)
+        if dest_ip:
+            conditions.append("dest_ip = %s")
+            params.append(dest_ip)
+        if min_size is not None:
+            conditions.append("packet_size >= %s")
+            params.append(min_size)
+        if max_size is not None:
+            conditions.append("packet_size <= %s")
+            params.append(max_size)
+        if since is not None:
+            conditions.append("timestamp >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < %s")
+            params.append(until)
+        if after is not None:
+            # The plain timestamp bound lets the planner prune partitions; the row comparison alone does not
+            conditions.append("timestamp <= %s AND (timestamp, id) < (%s, %s)")
+            params.extend((after[0], *after))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+
+        with self.connection() as conn:
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT id, source_ip, dest_ip, packet_size, protocol, timestamp, anomaly_flag
+
+            cursor.execute(f"""
+                SELECT id, source_ip, dest_ip, packet_size, protocol, timestamp, anomaly_flag, model_version
                 FROM packets
-                ORDER BY timestamp DESC
+                {where}
+                ORDER BY timestamp DESC, id DESC
                 LIMIT %s
-            """, (limit,))
-            
+            """, params)
+
             packets = cursor.fetchall()
             cursor.close()
-            self.connection_pool.putconn(conn)
-            return packets
+        return packets
+
+    def iter_training_data(self, since=None, chunk_size=TRAIN_CHUNK_SIZE, flows=False):
+        """Stream (packet_size, protocol) rows in chunks through a server-side cursor
+
+        With `flows`, rows are (packet_size, protocol, source_ip, dest_ip, timestamp)
+        in arrival order, for replaying through the flow feature engine. Errors
+        are raised, so a broken stream never passes for a smaller sample.
+        """
+        try:
+            # The connection goes back to the pool (rolled back) when the generator finishes or is closed
+            with self.connection() as conn:
+                # A named cursor keeps the result set on the server; only one chunk is in memory
+                cursor = conn.cursor(name='training_data')
+                cursor.itersize = chunk_size
+
+                columns = "packet_size, protocol, source_ip, dest_ip, timestamp" if flows else "packet_size, protocol"
+                where = "WHERE timestamp >= %s" if since is not None else ""
+                order = "ORDER BY timestamp, id" if flows else ""
+                cursor.execute(f"SELECT {columns} FROM packets {where} {order}", (since,) if since is not None else None)
+
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+                cursor.close()
         except Exception as e:
-            print(f"❌ Error fetching packets: {e}")
-            return []
+            print(f"❌ Error streaming training data: {e}")
+            raise
+
+    def iter_packets(self, since=None, until=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Stream full packet rows in (timestamp, id) order, in chunks, through a server-side cursor; errors are raised"""
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append("timestamp >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < %s")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
 
-    def get_training_data(self):
-        """Get data for ML training"""
         try:
-            conn = self.connection_pool.getconn()
+            with self.connection() as conn:
+                cursor = conn.cursor(name='packet_export')
+                cursor.itersize = chunk_size
+                cursor.execute(f"""
+                    SELECT id, source_ip, dest_ip, packet_size, protocol, timestamp, anomaly_flag, model_version
+                    FROM packets
+                    {where}
+                    ORDER BY timestamp, id
+                """, params)
+
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+                cursor.close()
+        except Exception as e:
+            print(f"❌ Error streaming packets: {e}")
+            raise
+
+    @contextmanager
+    def advisory_lock(self, lock_id):
+        """Hold a session-level advisory lock for a with block; yields False if another session holds it"""
+        with self.connection() as conn:
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT packet_size, protocol
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (lock_id,))
+            acquired = cursor.fetchone()[0]
+            conn.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+                    conn.commit()
+                cursor.close()
+
+    def read_rescore_chunk(self, after, since, until, limit):
+        """Up to `limit` rows with timestamp < until, in (timestamp, id) order after `after`
+
+        Each chunk is read through a server-side cursor in its own short
+        transaction, so walking the whole table never pins a snapshot or
+        holds locks for longer than one chunk. Raises on database errors.
+        """
+        conditions = ["timestamp < %s"]
+        params = [until]
+        if after is not None:
+            # The plain timestamp bound lets the planner prune partitions; the row comparison alone does not
+            conditions.append("timestamp >= %s AND (timestamp, id) > (%s, %s)")
+            params.extend((after[0], *after))
+        elif since is not None:
+            conditions.append("timestamp >= %s")
+            params.append(since)
+        params.append(limit)
+
+        with self.connection() as conn:
+            cursor = conn.cursor(name='rescore_chunk')
+            cursor.itersize = limit
+            cursor.execute(f"""
+                SELECT id, timestamp, source_ip, dest_ip, packet_size, protocol, anomaly_flag, model_version
                 FROM packets
-            """)
-            
-            data = cursor.fetchall()
+                WHERE {' AND '.join(conditions)}
+                ORDER BY timestamp, id
+                LIMIT %s
+            """, params)
+            rows = cursor.fetchall()
             cursor.close()
-            self.connection_pool.putconn(conn)
-            return data
-        except Exception as e:
-            print(f"❌ Error fetching training data: {e}")
-            return []
+            conn.commit()
+        return rows
+
+    def apply_rescore(self, updates, checkpoint):
+        """Write new verdicts, correct the rollups and save the checkpoint in one short transaction
+
+        `updates` are (timestamp, id, old_flag, new_flag) rows in key order.
+        A row is only rewritten while it still holds old_flag, and the rollups
+        are corrected from the rows actually flipped, so re-running a batch
+        is harmless. Adds the flips to checkpoint['rows_changed'] and returns
+        their number. Raises on database errors.
+        """
+        version = int(checkpoint['model_version'])
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            changed = []
+            if updates:
+                # Literal bounds let the planner prune partitions outside this batch
+                bounds = cursor.mogrify("p.timestamp >= %s AND p.timestamp <= %s",
+                                        (updates[0][0], updates[-1][0])).decode()
+                changed = execute_values(cursor, f"""
+                    UPDATE packets p SET anomaly_flag = v.new_flag, model_version = {version}
+                    FROM (VALUES %s) AS v(timestamp, id, old_flag, new_flag)
+                    WHERE {bounds}
+                      AND p.timestamp = v.timestamp AND p.id = v.id
+                      AND p.anomaly_flag IS NOT DISTINCT FROM v.old_flag
+                    RETURNING p.timestamp, p.protocol, v.old_flag, v.new_flag
+                """, updates, template="(%s::timestamp, %s::bigint, %s::boolean, %s::boolean)",
+                    page_size=len(updates), fetch=True)
+
+            deltas = {}
+            flipped = 0
+            for timestamp, protocol, old_flag, new_flag in changed:
+                if bool(old_flag) != bool(new_flag):
+                    key = (timestamp.replace(second=0, microsecond=0), protocol)
+                    deltas[key] = deltas.get(key, 0) + (1 if new_flag else -1)
+                    flipped += 1
+            self.adjust_anomaly_rollups(cursor, deltas)
+
+            checkpoint['rows_changed'] += flipped
+            self.save_rescore_checkpoint(checkpoint, cursor)
+            conn.commit()
+            cursor.close()
+        return flipped
+
+    def adjust_anomaly_rollups(self, cursor, deltas):
+        """Apply {(minute, protocol): anomaly delta} to the rollups and totals (caller commits)"""
+        self.adjust_rollups(cursor, sorted(
+            (bucket, protocol, 0, delta, 0) for (bucket, protocol), delta in deltas.items() if delta
+        ))
+
+    def adjust_rollups(self, cursor, minutes):
+        """Add sorted (minute, protocol, packets, anomalies, bytes) deltas to the rollups and totals (caller commits)"""
+        if not minutes:
+            return
+
+        protocols = {}
+        for bucket, protocol, *delta in minutes:
+            totals = protocols.setdefault(protocol, [0, 0, 0])
+            for i, value in enumerate(delta):
+                totals[i] += value
+
+        # Same lock order as update_rollups: minute rows, then totals, each sorted
+        execute_values(cursor, """
+            UPDATE packet_stats_minute m SET
+                packets = m.packets + d.packets,
+                anomalies = m.anomalies + d.anomalies,
+                bytes = m.bytes + d.bytes
+            FROM (VALUES %s) AS d(bucket, protocol, packets, anomalies, bytes)
+            WHERE m.bucket = d.bucket AND m.protocol = d.protocol
+        """, minutes, template="(%s::timestamp, %s, %s::bigint, %s::bigint, %s::bigint)", page_size=len(minutes))
+        self.adjust_totals(cursor, protocols)
+
+    def adjust_totals(self, cursor, protocols):
+        """Add {protocol: [packets, anomalies, bytes]} deltas to the running totals (caller commits)
+
+        Live listeners are notified of the net change.
+        """
+        if not protocols:
+            return
+        self.add_totals(cursor, protocols)
+
+        if LIVE_FEED:
+            notify_delta(cursor, json.dumps({
+                'packets': [],
+                'delta': {
+                    'total': sum(delta[0] for delta in protocols.values()),
+                    'anomalies': sum(delta[1] for delta in protocols.values()),
+                    'bytes': sum(delta[2] for delta in protocols.values()),
+                    'protocols': {
+                        protocol: {'total': packets, 'anomalies': anomalies, 'bytes': size}
+                        for protocol, (packets, anomalies, size) in protocols.items()
+                    }
+                }
+            }))
+
+    def get_rescore_checkpoint(self, model_version):
+        """Saved progress of the rescoring job for a model version, or None"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT model_version, last_timestamp, last_id, upper_timestamp, rows_scored, rows_changed, status
+                FROM rescore_checkpoints
+                WHERE model_version = %s
+            """, (model_version,))
+            row = cursor.fetchone()
+            cursor.close()
+        if row is None:
+            return None
+        return dict(zip(('model_version', 'last_timestamp', 'last_id', 'upper_timestamp',
+                         'rows_scored', 'rows_changed', 'status'), row))
+
+    def save_rescore_checkpoint(self, checkpoint, cursor=None):
+        """Upsert a rescoring checkpoint; with `cursor` it joins the caller's transaction (caller commits)"""
+        if cursor is None:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                self.save_rescore_checkpoint(checkpoint, cursor)
+                conn.commit()
+                cursor.close()
+            return
+        cursor.execute("""
+            INSERT INTO rescore_checkpoints
+                (model_version, last_timestamp, last_id, upper_timestamp, rows_scored, rows_changed, status, updated_at)
+            VALUES (%(model_version)s, %(last_timestamp)s, %(last_id)s, %(upper_timestamp)s,
+                    %(rows_scored)s, %(rows_changed)s, %(status)s, now())
+            ON CONFLICT (model_version) DO UPDATE SET
+                last_timestamp = EXCLUDED.last_timestamp,
+                last_id = EXCLUDED.last_id,
+                upper_timestamp = EXCLUDED.upper_timestamp,
+                rows_scored = EXCLUDED.rows_scored,
+                rows_changed = EXCLUDED.rows_changed,
+                status = EXCLUDED.status,
+                updated_at = EXCLUDED.updated_at
+        """, checkpoint)
 
     def get_stats(self):
-        """Get statistics about packets"""
-        try:
-            conn = self.connection_pool.getconn()
+        """Get statistics about packets from the maintained totals. Raises on database errors."""
+        return self.get_stats_snapshot()[0]
+
+    def get_stats_snapshot(self):
+        """(stats, snapshot): the totals and the txid snapshot they were read at. Raises on database errors.
+
+        A live-feed delta whose txid had committed by the snapshot is already
+        included in these totals.
+        """
+        with self.connection() as conn:
             cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) FROM packets")
-            total = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM packets WHERE anomaly_flag = TRUE")
-            anomalies = cursor.fetchone()[0]
-            
+            # Both statements read the same snapshot
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("SELECT txid_current_snapshot()::text")
+            snapshot = parse_snapshot(cursor.fetchone()[0])
+            cursor.execute("""
+                SELECT protocol, SUM(packets)::bigint, SUM(anomalies)::bigint, SUM(bytes)::bigint
+                FROM packet_stats_total
+                GROUP BY protocol
+            """)
+            rows = cursor.fetchall()
+            conn.commit()
             cursor.close()
-            self.connection_pool.putconn(conn)
-            return {'total': total, 'anomalies': anomalies}
-        except Exception as e:
-            print(f"❌ Error fetching stats: {e}")
-            return {'total': 0, 'anomalies': 0}
+
+        protocols = {
+            protocol: {'total': packets, 'anomalies': anomalies, 'bytes': size}
+            for protocol, packets, anomalies, size in rows
+        }
+        return {
+            'total': sum(p['total'] for p in protocols.values()),
+            'anomalies': sum(p['anomalies'] for p in protocols.values()),
+            'bytes': sum(p['bytes'] for p in protocols.values()),
+            'protocols': protocols
+        }, snapshot
+
+    def get_timeseries(self, minutes=60, protocol=None):
+        """Per-minute packet, anomaly and byte counts for the last `minutes` minutes. Raises on database errors."""
+        since = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=minutes - 1)
+        conditions = ["bucket >= %s"]
+        params = [since]
+        if protocol:
+            conditions.append("protocol = %s")
+            params.append(protocol)
+
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(f"""
+                SELECT bucket, SUM(packets)::BIGINT, SUM(anomalies)::BIGINT, SUM(bytes)::BIGINT
+                FROM packet_stats_minute
+                WHERE {' AND '.join(conditions)}
+                GROUP BY bucket
+                ORDER BY bucket
+            """, params)
+            rows = cursor.fetchall()
+
+            cursor.close()
+        return rows
 
     def close(self):
-        """Close all database connections"""
+        """Flush buffered writes and close all database connections"""
+        if self.write_buffer:
+            self.write_buffer.close()
         if self.connection_pool:
             self.connection_pool.closeall()
             print("✅ Database connections closed")
\ No newline at end of file
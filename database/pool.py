@@ -0,0 +1,156 @@
+# database/pool.py
+# Thread-safe, bounded PostgreSQL connection pool
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+import sys
+sys.path.append('..')
+from utils.config import DB_POOL_TIMEOUT, DB_POOL_CHECK_AFTER
+from utils import metrics
+
+pool_wait_seconds = metrics.histogram('netsentinel_db_pool_wait_seconds', 'Time spent checking out a pooled connection')
+pool_connections = metrics.gauge('netsentinel_db_pool_connections', 'Pooled database connections by state', ['state'])
+pool_timeouts = metrics.counter('netsentinel_db_pool_timeouts_total', 'Checkouts that gave up waiting for a connection')
+pool_replaced = metrics.counter('netsentinel_db_pool_replaced_total', 'Broken connections closed and replaced')
+
+class PoolTimeout(PoolError):
+    """No connection became free within the checkout timeout"""
+
+class ConnectionPool:
+    """Bounded pool of psycopg2 connections that threads can share
+
+    Checkout waits up to `timeout` seconds for a free connection instead of
+    failing at once. A connection idle for more than `check_after` seconds is
+    pinged before it is handed out. Connections come back rolled back; ones
+    that are closed or broken are discarded and replaced on demand.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=DB_POOL_TIMEOUT, check_after=DB_POOL_CHECK_AFTER, **dsn):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self.dsn = dsn
+        self.idle = []  # (connection, returned_at), most recently returned last
+        self.size = 0  # Connections open or being opened
+        self.closed = False
+        self.condition = threading.Condition()
+        for _ in range(minconn):
+            self.idle.append((self.connect(), time.monotonic()))
+            self.size += 1
+        pool_connections.labels('idle').set_function(lambda: len(self.idle))
+        pool_connections.labels('in_use').set_function(lambda: self.size - len(self.idle))
+
+    def connect(self):
+        return psycopg2.connect(**self.dsn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Check out a connection for the duration of a with block, returning it even if the block raises"""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds (default: the pool's)"""
+        start = time.perf_counter()
+        try:
+            return self.checkout(self.timeout if timeout is None else timeout)
+        finally:
+            pool_wait_seconds.observe(time.perf_counter() - start)
+
+    def checkout(self, timeout):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self.condition:
+                while True:
+                    if self.closed:
+                        raise PoolError("connection pool is closed")
+                    if self.idle:
+                        conn, returned_at = self.idle.pop()
+                        break
+                    if self.size < self.maxconn:
+                        # Reserve the slot; the connection is opened outside the lock
+                        self.size += 1
+                        conn = None
+                        break
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        pool_timeouts.inc()
+                        raise PoolTimeout(f"No database connection free within {timeout}s ({self.maxconn} in use)")
+                    self.condition.wait(remaining)
+
+            if conn is None:
+                try:
+                    return self.connect()
+                except Exception:
+                    self.release_slot()
+                    raise
+            if self.healthy(conn, returned_at):
+                return conn
+            pool_replaced.inc()
+            self.discard(conn)
+
+    def healthy(self, conn, returned_at):
+        """False for closed connections and for idle ones that fail a ping"""
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def putconn(self, conn, close=False):
+        """Return a connection; an open transaction is rolled back first"""
+        if not close and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    close = True
+
+        with self.condition:
+            if not (close or conn.closed or self.closed):
+                self.idle.append((conn, time.monotonic()))
+                self.condition.notify()
+                return
+        self.discard(conn)
+
+    def discard(self, conn):
+        """Close a connection and free its slot"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self.release_slot()
+
+    def release_slot(self):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def closeall(self):
+        """Close idle connections now and the rest as they are returned"""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.condition.notify_all()
+        for conn, _ in idle:
+            self.discard(conn)
@@ -1,36 +1,116 @@
 # ml/anomaly_model.py
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import LabelEncoder
+# scikit-learn is imported only where a model is fitted or unpickled, so processes
+# that score with the compiled forest start without it
 import numpy as np
 import pickle
 import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
 import sys
 sys.path.append('..')
-from utils.config import MODEL_PATH, CONTAMINATION, PROTOCOLS
+from utils.config import (MODEL_PATH, CONTAMINATION, PROTOCOLS, TRAIN_SAMPLE_SIZE, TRAIN_WINDOW_HOURS,
+                          MODEL_WATCH_INTERVAL, INFERENCE_BACKEND, FLOW_FEATURES)
+from ml.model_registry import ModelRegistry
+from ml.features import FlowFeatureEngine, FEATURE_NAMES
+
+RESCORE_WAIT_INTERVAL = 5  # Seconds between attempts while another job holds the rescoring lock
+
+def reservoir_sample(reservoir, seen, chunk, rng):
+    """Vectorized reservoir sampling (Algorithm R): add `chunk` after `seen` rows
+
+    Every row streamed so far ends up in `reservoir` with equal probability.
+    Returns the new number of rows seen.
+    """
+    capacity = len(reservoir)
+    count = len(chunk)
+
+    # Fill phase: the first `capacity` rows are taken as is
+    fill = min(max(capacity - seen, 0), count)
+    reservoir[seen:seen + fill] = chunk[:fill]
+
+    # Replacement phase: row i replaces a random slot with probability capacity / (i + 1)
+    rest = chunk[fill:]
+    if len(rest):
+        positions = np.arange(seen + fill, seen + count)
+        slots = rng.integers(0, positions + 1)
+        keep = slots < capacity
+        reservoir[slots[keep]] = rest[keep]
+
+    return seen + count
 
 class AnomalyDetector:
-    def __init__(self):
+    def __init__(self, watch=False, backend=INFERENCE_BACKEND, flow_features=FLOW_FEATURES, background=False,
+                 registry=None, load=True):
         self.model = None
-        self.label_encoder = LabelEncoder()
-        self.label_encoder.fit(PROTOCOLS)
-        self.load_model()
+        # Windowed per-flow aggregates, appended to [packet_size, protocol] as extra columns
+        self.flows = FlowFeatureEngine() if flow_features else None
+        # 'compiled' scores with the exported NumPy forest instead of the sklearn object
+        self.compiled = backend == 'compiled'
+        self.model_version = None
+        self.registry = registry if registry is not None else ModelRegistry()
+        # The codes of a LabelEncoder fitted on PROTOCOLS (sorted classes), which trained models expect
+        self.protocol_codes = {p: i for i, p in enumerate(sorted(PROTOCOLS))}
+        # Without `load` the caller sets the model itself, and an empty registry is never bootstrapped
+        if load:
+            self.load_model(background)
+        if watch:
+            threading.Thread(target=self.watch_model, name='model-watcher', daemon=True).start()
+
+    def load_model(self, background=False):
+        """Load the current model version; with an empty registry, create the first one
+
+        With `background` set, the first model is built in a thread while the
+        caller carries on; until it is ready every packet is scored as normal.
+        """
+        version = self.registry.current_version()
+        if version is not None:
+            try:
+                self.model = self.registry.load(version, compiled=self.compiled)
+                self.model_version = version
+                print(f"✅ ML Model v{version} loaded successfully")
+                return
+            except Exception as e:
+                print(f"⚠️ Error loading model v{version}: {e}")
+
+        if background:
+            print("⚠️ No model yet. Preparing one in the background (packets are scored as normal meanwhile)...")
+            threading.Thread(target=self.bootstrap_model, name='model-bootstrap', daemon=True).start()
+        else:
+            self.bootstrap_model()
 
-    def load_model(self):
-        """Load the trained model from disk"""
+    def bootstrap_model(self):
+        """First registry version: the legacy MODEL_PATH pickle if there is one, else a synthetic-data model"""
         if os.path.exists(MODEL_PATH):
             try:
                 with open(MODEL_PATH, 'rb') as f:
-                    self.model = pickle.load(f)
-                print("✅ ML Model loaded successfully")
+                    self.publish_first(pickle.load(f))
+                print("✅ Legacy ML model imported into the registry")
+                return
             except Exception as e:
                 print(f"⚠️ Error loading model: {e}. Training new model...")
-                self.train_initial_model()
         else:
             print("⚠️ No model found. Training initial model...")
-            self.train_initial_model()
+        self.train_initial_model()
+
+    def publish_first(self, model):
+        """Publish `model` unless another process published a version meanwhile, then use that one"""
+        version = self.registry.current_version()
+        if version is None:
+            self.model = model
+            self.save_model()
+            return
+        self.model = self.registry.load(version, compiled=self.compiled)
+        self.model_version = version
 
     def train_initial_model(self):
-        """Train initial model with synthetic data"""
+        """Train initial model with synthetic data
+
+        The model sees packet size and protocol only, even with flow features
+        on: made-up rates would not match any real network, and the first
+        retrain on stored traffic brings in the real flow statistics.
+        """
         # Generate synthetic normal traffic
         np.random.seed(42)
         normal_sizes = np.random.normal(1000, 300, 900)
@@ -50,55 +130,231 @@ class AnomalyDetector:
         ])
         
         # Train model
-        self.model = IsolationForest(contamination=CONTAMINATION, random_state=42)
-        self.model.fit(X)
-        self.save_model()
+        from sklearn.ensemble import IsolationForest
+        model = IsolationForest(contamination=CONTAMINATION, random_state=42)
+        model.fit(X)
+        self.publish_first(model)
         print("✅ Initial model trained and saved")
 
-    def train_from_database(self, db):
-        """Retrain model using database data"""
+    def train_from_database(self, db, sample_size=TRAIN_SAMPLE_SIZE, window_hours=TRAIN_WINDOW_HOURS):
+        """Retrain model on a bounded random sample streamed from the database"""
+        since = datetime.now() - timedelta(hours=window_hours) if window_hours else None
+        flows = self.flows is not None
+
+        def batches():
+            for rows in db.iter_training_data(since, flows=flows):
+                sizes = np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+                protocols = [row[1] for row in rows]
+                if not flows:
+                    yield sizes, protocols, None, None, None
+                    continue
+                yield (sizes, protocols, [row[2] for row in rows], [row[3] for row in rows],
+                       [row[4].timestamp() for row in rows])
+
+        return self.train_from_batches(batches(), sample_size)
+
+    def train_from_batches(self, batches, sample_size=TRAIN_SAMPLE_SIZE, publish=True):
+        """Retrain on a reservoir sample of column batches in arrival order
+
+        Each batch is (packet_sizes, protocols, source_ips, dest_ips, unix_timestamps);
+        the last three are only read when flow features are enabled. With
+        `publish` False the model is fitted but not saved to the registry.
+        Returns False if there is too little data; errors are raised.
+        """
         try:
-            data = db.get_training_data()
-            if len(data) < 50:
+            rng = np.random.default_rng(42)
+            width = 2 + (len(FEATURE_NAMES) if self.flows is not None else 0)
+            reservoir = np.empty((sample_size, width), dtype=np.float64)
+            seen = 0
+            # Packets are replayed in timestamp order through a fresh engine so each
+            # training row has the flow features it had when it was received
+            flows = FlowFeatureEngine() if self.flows is not None else None
+            
+            for sizes, protocols, source_ips, dest_ips, timestamps in batches:
+                sizes = np.asarray(sizes, dtype=np.float64)
+                protocol_encoded = self.encode_protocols(protocols)
+                chunk = np.column_stack([sizes, protocol_encoded])
+                if flows is not None:
+                    chunk = np.column_stack([chunk, flows.update_batch(source_ips, dest_ips, sizes, timestamps)])
+                seen = reservoir_sample(reservoir, seen, chunk[protocol_encoded >= 0], rng)
+            
+            if seen < 50:
                 print("⚠️ Not enough data for training. Need at least 50 samples.")
                 return False
             
-            # Prepare features
-            X = []
-            for packet_size, protocol in data:
-                protocol_encoded = self.label_encoder.transform([protocol])[0]
-                X.append([packet_size, protocol_encoded])
-            
-            X = np.array(X)
+            X = reservoir[:min(seen, sample_size)]
             
             # Train new model
+            from sklearn.ensemble import IsolationForest
             self.model = IsolationForest(contamination=CONTAMINATION, random_state=42)
             self.model.fit(X)
-            self.save_model()
-            print(f"✅ Model retrained with {len(data)} samples")
+            if publish:
+                self.save_model()
+            print(f"✅ Model retrained with {len(X)} samples (from {seen} rows)")
             return True
         except Exception as e:
             print(f"❌ Error training model: {e}")
-            return False
+            raise
 
-    def predict(self, packet_size, protocol):
+    def uses_flow_features(self, model):
+        """Whether a model was trained with the flow feature columns"""
+        return getattr(model, 'n_features_in_', 2) > 2
+
+    def predict(self, packet_size, protocol, source_ip=None, dest_ip=None):
         """Predict if a packet is anomalous"""
         try:
-            protocol_encoded = self.label_encoder.transform([protocol])[0]
-            X = np.array([[packet_size, protocol_encoded]])
-            prediction = self.model.predict(X)
+            model = self.model
+            # Flows are updated for every packet so their state stays current
+            flow = None
+            if self.flows is not None and source_ip is not None:
+                flow = self.flows.update(source_ip, dest_ip, packet_size)
+            if model is None:
+                return False
+            
+            protocol_encoded = self.protocol_codes[protocol]
+            row = [packet_size, protocol_encoded]
+            if self.uses_flow_features(model):
+                row.extend(flow if flow is not None else [0.0] * len(FEATURE_NAMES))
+            X = np.array([row])
+            prediction = model.predict(X)
             # Isolation Forest returns -1 for anomalies, 1 for normal
             return prediction[0] == -1
         except Exception as e:
             print(f"❌ Error in prediction: {e}")
             return False
 
+    def encode_protocols(self, protocols):
+        """Map protocol names to model codes; unknown protocols become -1"""
+        codes = self.protocol_codes
+        return np.fromiter((codes.get(p, -1) for p in protocols), dtype=np.int64, count=len(protocols))
+
+    def predict_batch(self, packet_sizes, protocols, source_ips=None, dest_ips=None):
+        """Predict anomalies for many packets with a single model call"""
+        flows_updated = False
+        try:
+            model = self.model
+            sizes = np.asarray(packet_sizes, dtype=np.float64)
+            protocol_encoded = self.encode_protocols(protocols)
+            flags = np.zeros(len(sizes), dtype=bool)
+            
+            X = np.column_stack([sizes, protocol_encoded])
+            flow = None
+            if self.flows is not None and source_ips is not None:
+                flow = self.flows.update_batch(source_ips, dest_ips, sizes)
+                flows_updated = True
+            if self.uses_flow_features(model):
+                X = np.column_stack([X, flow if flow is not None else np.zeros((len(sizes), len(FEATURE_NAMES)))])
+
+            # Unknown protocols are reported as normal, like predict(), as is everything before the first model
+            known = protocol_encoded >= 0
+            if model is not None and known.any():
+                flags[known] = model.predict(X[known]) == -1
+            return flags
+        except Exception as e:
+            # Score one at a time, so a single bad row is the only one reported as normal
+            print(f"❌ Error in batch prediction, scoring {len(packet_sizes)} packets one at a time: {e}")
+            if source_ips is None or flows_updated:
+                source_ips = dest_ips = [None] * len(packet_sizes)
+            return np.array([
+                self.predict(packet_size, protocol, source_ip, dest_ip)
+                for packet_size, protocol, source_ip, dest_ip in zip(packet_sizes, protocols, source_ips, dest_ips)
+            ], dtype=bool)
+
     def save_model(self):
-        """Save the trained model to disk"""
+        """Publish the trained model as a new version in the registry; errors are raised"""
         try:
-            os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-            with open(MODEL_PATH, 'wb') as f:
-                pickle.dump(self.model, f)
-            print("✅ Model saved successfully")
+            self.model_version = self.registry.publish(self.model)
+            if self.compiled:
+                self.model = self.registry.load(self.model_version, compiled=True)
+            print(f"✅ Model v{self.model_version} saved successfully")
         except Exception as e:
-            print(f"❌ Error saving model: {e}")
\ No newline at end of file
+            print(f"❌ Error saving model: {e}")
+            raise
+
+    def watch_model(self, interval=MODEL_WATCH_INTERVAL):
+        """Hot-swap to whichever version CURRENT points to (new model or rollback)"""
+        while True:
+            time.sleep(interval)
+            version = self.registry.current_version()
+            if version is None or version == self.model_version:
+                continue
+            try:
+                model = self.registry.load(version, compiled=self.compiled)
+                # Single attribute assignment: in-flight predictions finish on the old model
+                self.model, self.model_version = model, version
+                print(f"🔄 Switched to ML model v{version}")
+            except Exception as e:
+                print(f"⚠️ Could not load model v{version}: {e}")
+
+def retrain_job(job_id):
+    """Retraining entry point for a worker process; status goes to the registry
+
+    The job ends once the model is published. Rescoring stored packets with
+    it is a separate job (rescore_job), so it never holds up the next retrain.
+    """
+    from database.db import Database
+
+    registry = ModelRegistry()
+    registry.write_job(job_id, status='running', pid=os.getpid(), started_at=datetime.now().isoformat())
+    db = Database()
+    try:
+        detector = AnomalyDetector()
+        if detector.train_from_database(db):
+            registry.write_job(job_id, status='succeeded', version=detector.model_version,
+                               finished_at=datetime.now().isoformat())
+        else:
+            registry.write_job(job_id, status='failed', error='Not enough data to retrain',
+                               finished_at=datetime.now().isoformat())
+    except Exception as e:
+        registry.write_job(job_id, status='failed', error=str(e), finished_at=datetime.now().isoformat())
+    finally:
+        db.close()
+        registry.release('retrain', job_id)
+    return registry.read_job(job_id)
+
+class RescoreSuperseded(Exception):
+    """The version being applied is no longer the current model"""
+
+def rescore_job(job_id, version, restart=False):
+    """Rescoring entry point for a worker process: apply `version` to stored packets; status goes to the registry
+
+    While another job holds the rescoring lock this one waits, and once
+    `version` stops being current (a newer model or a rollback) it stops as
+    'superseded'; its checkpoint is kept, so ml/rescore.py can resume it.
+    """
+    from database.db import Database
+    from ml.rescore import rescore, RescoreBusy
+
+    registry = ModelRegistry()
+    registry.write_job(job_id, status='running', pid=os.getpid(), started_at=datetime.now().isoformat())
+    db = Database()
+
+    def progress(checkpoint):
+        registry.write_job(job_id, rows_rescored=checkpoint['rows_scored'], flags_changed=checkpoint['rows_changed'])
+        if registry.current_version() != version:
+            raise RescoreSuperseded()
+
+    try:
+        detector = AnomalyDetector(load=False, registry=registry)
+        while True:
+            if registry.current_version() != version:
+                raise RescoreSuperseded()
+            try:
+                checkpoint = rescore(db, detector, restart=restart, progress=progress, version=version)
+                break
+            except RescoreBusy:
+                registry.write_job(job_id, status='waiting')
+                time.sleep(RESCORE_WAIT_INTERVAL)
+        registry.write_job(job_id, status='succeeded', rows_rescored=checkpoint['rows_scored'],
+                           flags_changed=checkpoint['rows_changed'], finished_at=datetime.now().isoformat())
+    except RescoreSuperseded:
+        registry.write_job(job_id, status='superseded', finished_at=datetime.now().isoformat())
+    except Exception as e:
+        registry.write_job(job_id, status='failed', error=str(e), finished_at=datetime.now().isoformat())
+    finally:
+        db.close()
+    return registry.read_job(job_id)
+
+def new_job_id():
+    """Identifier for a retraining job"""
+    return uuid.uuid4().hex[:12]
\ No newline at end of file
@@ -0,0 +1,245 @@
+# ml/compiled_forest.py
+# Dependency-light inference for a fitted IsolationForest: the trees are
+# flattened into contiguous NumPy arrays and evaluated for a whole batch at once.
+import io
+import mmap
+import struct
+import zipfile
+import numpy as np
+
+SCORE_CHUNK_SIZE = 65536  # (tree, row) pairs traversed at once; small enough for the working arrays to stay in cache
+HEAP_MAX_DEPTH = 12  # Deepest trees laid out as complete binary trees; deeper ones are walked node by node
+
+
+def average_path_length(n_samples):
+    """c(n): average path length of an unsuccessful BST search, as in sklearn"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    result[n_samples == 2] = 1.0
+    deep = n_samples > 2
+    n = n_samples[deep]
+    result[deep] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return result
+
+
+def _node_path_lengths(children_left, children_right):
+    """Number of nodes on the path from the root to each node (root = 1)"""
+    lengths = np.zeros(len(children_left), dtype=np.float64)
+    lengths[0] = 1.0
+    # Children always have larger ids than their parent in sklearn trees
+    for node in range(len(children_left)):
+        if children_left[node] != -1:
+            lengths[children_left[node]] = lengths[node] + 1.0
+            lengths[children_right[node]] = lengths[node] + 1.0
+    return lengths
+
+
+def export_forest(model):
+    """Flatten a fitted IsolationForest into arrays; returns .npz bytes"""
+    n_features = model.n_features_in_
+    subsample_features = model._max_features != n_features
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree, tree_features in zip(model.estimators_, model.estimators_features_):
+        t = tree.tree_
+        left = t.children_left.astype(np.int64)
+        right = t.children_right.astype(np.int64)
+        is_leaf = left == -1
+        path_lengths = _node_path_lengths(left, right)
+
+        # Trees fitted on a feature subset index into that subset
+        feature = t.feature.astype(np.int64)
+        if subsample_features:
+            feature = np.where(is_leaf, 0, np.asarray(tree_features)[np.maximum(feature, 0)])
+        features.append(np.where(is_leaf, 0, feature))
+        thresholds.append(t.threshold.astype(np.float64))
+        lefts.append(np.where(is_leaf, -1, left + offset))
+        rights.append(np.where(is_leaf, -1, right + offset))
+
+        # A leaf contributes its path length plus the expected depth of the
+        # unbuilt subtree below it, exactly as sklearn's score_samples does
+        values.append(np.where(is_leaf, path_lengths + average_path_length(t.n_node_samples) - 1.0, 0.0))
+        roots.append(offset)
+        offset += t.node_count
+        max_depth = max(max_depth, int(path_lengths.max()))
+
+    max_samples = getattr(model, '_max_samples', None) or model.max_samples_
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        value=np.concatenate(values),
+        roots=np.asarray(roots, dtype=np.int32),
+        max_depth=np.int64(max_depth),
+        denominator=np.float64(len(model.estimators_) * average_path_length([max_samples])[0]),
+        offset=np.float64(model.offset_),
+        n_features=np.int64(n_features)
+    )
+    return buffer.getvalue()
+
+
+def load_arrays(path):
+    """Arrays of an .npz file, memory-mapped read-only where possible
+
+    np.savez stores members uncompressed, so each array's data sits at a fixed
+    offset in the file and can be used in place: loading costs no copy, and
+    processes scoring with the same version share the pages.
+    """
+    arrays = {}
+    with open(path, 'rb') as f, zipfile.ZipFile(f) as archive:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.lib.format.read_array(archive.open(info))
+                continue
+
+            # Local file header: 30 fixed bytes, then the file name and extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            start = info.header_offset + 30 + name_length + extra_length
+            f.seek(start)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            if not shape or dtype.hasobject:
+                # Scalars are read as is
+                f.seek(start)
+                arrays[name] = np.lib.format.read_array(f)
+                continue
+            count = int(np.prod(shape))
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=f.tell()).reshape(
+                shape, order='F' if fortran_order else 'C'
+            )
+    return arrays
+
+
+def _float32_at_most(values):
+    """Largest float32 <= each float64, so `x <= t` gives the same answer for float32 x"""
+    rounded = values.astype(np.float32)
+    return np.where(rounded > values, np.nextafter(rounded, np.float32(-np.inf)), rounded)
+
+
+def heap_layout(arrays, depth):
+    """Trees padded into complete binary trees of `depth` levels, in heap order
+
+    Returns (feature, threshold, value): per tree, 2**depth - 1 split slots
+    and 2**depth leaf slots. A leaf above the last level becomes a split
+    whose whole subtree of leaf slots carries its value, so every row takes
+    exactly `depth` steps and a node's children are found by arithmetic
+    (2h + 1, 2h + 2) instead of lookups.
+    """
+    n_trees = len(arrays['roots'])
+    width = 2 ** depth - 1
+    feature = np.zeros((n_trees, width), dtype=np.int32)
+    threshold = np.zeros((n_trees, width), dtype=np.float32)
+    value = np.zeros((n_trees, width + 1), dtype=np.float64)
+
+    # Frontier of (tree, node, heap slot), one level at a time
+    tree = np.arange(n_trees)
+    node = arrays['roots'].astype(np.int64)
+    slot = np.zeros(n_trees, dtype=np.int64)
+    for level in range(depth + 1):
+        leaf = arrays['left'][node] == -1
+        if leaf.any():
+            span = 2 ** (depth - level)
+            first = (slot[leaf] + 1) * span - 1 - width
+            value[tree[leaf][:, None], first[:, None] + np.arange(span)] = arrays['value'][node[leaf]][:, None]
+        tree, node, slot = tree[~leaf], node[~leaf], slot[~leaf]
+        if level == depth:
+            break
+        feature[tree, slot] = arrays['feature'][node]
+        threshold[tree, slot] = _float32_at_most(arrays['threshold'][node])
+        tree = np.concatenate([tree, tree])
+        node = np.concatenate([arrays['left'][node], arrays['right'][node]]).astype(np.int64)
+        slot = np.concatenate([2 * slot + 1, 2 * slot + 2])
+    return feature.ravel(), threshold.ravel(), value.ravel()
+
+
+class CompiledForest:
+    """Vectorized IsolationForest scorer with sklearn's predict/score semantics"""
+
+    def __init__(self, arrays):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.max_depth = int(arrays['max_depth'])
+        self.denominator = float(arrays['denominator'])
+        self.offset_ = float(arrays['offset'])
+        self.n_features_in_ = int(arrays['n_features'])
+        # max_depth counts nodes on the longest path; the heap needs its number of splits
+        self.depth = self.max_depth - 1
+        self.heap = heap_layout(arrays, self.depth) if self.depth <= HEAP_MAX_DEPTH else None
+
+    @classmethod
+    def load(cls, path):
+        """Load an exported forest (memory-mapped)"""
+        return cls(load_arrays(path))
+
+    def _path_lengths(self, X):
+        """Sum over trees of each row's isolation path length (complete-tree layout)
+
+        Positions are (trees x rows), so consecutive lookups hit the same
+        tree's slots. Each level is three gathers and a compare.
+        """
+        feature, threshold, value = self.heap
+        n_trees, n_features = len(self.roots), X.shape[1]
+        width = 2 ** self.depth - 1
+        split_base = (np.arange(n_trees, dtype=np.int32) * width)[:, None]
+        leaf_base = (np.arange(n_trees, dtype=np.int32) * (width + 1) - width)[:, None]
+        flat = X.ravel()
+        row_offset = (np.arange(len(X), dtype=np.int32) * n_features)[None, :]
+
+        slot = np.zeros((n_trees, len(X)), dtype=np.int32)
+        for _ in range(self.depth):
+            index = slot + split_base
+            go_left = flat.take(feature.take(index) + row_offset) <= threshold.take(index)
+            slot *= 2
+            slot += 2
+            slot -= go_left
+        return value.take(slot + leaf_base).sum(axis=0)
+
+    def _walk_nodes(self, X):
+        """Sum over trees of each row's isolation path length, following the node arrays"""
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.left[node]
+            internal = left != -1
+            if not internal.any():
+                break
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(internal, np.where(go_left, left, self.right[node]), node)
+        return self.value[node].sum(axis=1)
+
+    def score_samples(self, X):
+        """Opposite of the anomaly score, as IsolationForest.score_samples"""
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        path_lengths = self._path_lengths if self.heap is not None else self._walk_nodes
+        chunk = max(1, SCORE_CHUNK_SIZE // len(self.roots))
+        depths = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), chunk):
+            depths[start:start + chunk] = path_lengths(X[start:start + chunk])
+        if self.denominator == 0:
+            return -np.ones(len(X))
+        return -(2.0 ** (-depths / self.denominator))
+
+    def decision_function(self, X):
+        """Negative values are anomalies"""
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        """-1 for anomalies, 1 for normal samples"""
+        return np.where(self.decision_function(X) < 0, -1, 1)
@@ -0,0 +1,190 @@
+# ml/features.py
+# Streaming per-flow features: what each source and (source, destination) pair
+# has been doing over the last few seconds, kept in bounded memory.
+import math
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import sys
+sys.path.append('..')
+from utils.config import (FLOW_WINDOW_SECONDS, FLOW_MAX_SOURCES, FLOW_MAX_PAIRS, FLOW_TTL_SECONDS,
+                          FLOW_HLL_PRECISION)
+
+# Extra model columns, appended after [packet_size, protocol_encoded]
+FEATURE_NAMES = (
+    'src_packet_rate',     # Packets/s from the source
+    'src_byte_rate',       # Bytes/s from the source
+    'src_distinct_dests',  # Distinct destinations of the source (HyperLogLog)
+    'src_size_std',        # Standard deviation of the source's packet sizes
+    'pair_packet_rate',    # Packets/s from the source to this destination
+    'pair_byte_rate'       # Bytes/s from the source to this destination
+)
+
+class HyperLogLog:
+    """Distinct-count sketch over two rotating windows
+
+    Registers of the current and previous window are kept; the estimate is
+    over their union, so it covers between one and two windows of traffic.
+    The union's harmonic sum and zero count are maintained incrementally, which
+    makes both add() and estimate() O(1).
+    """
+    __slots__ = ('precision', 'current', 'union', 'harmonic', 'zeros')
+
+    def __init__(self, precision=FLOW_HLL_PRECISION):
+        self.precision = precision
+        size = 1 << precision
+        self.current = bytearray(size)
+        self.union = bytearray(size)
+        self.harmonic = float(size)  # Sum of 2^-register over the union
+        self.zeros = size
+
+    def add(self, value):
+        """Add a hashable value"""
+        h = hash(value) & 0xFFFFFFFFFFFFFFFF
+        index = h & ((1 << self.precision) - 1)
+        bits = 64 - self.precision
+        rank = bits - (h >> self.precision).bit_length() + 1
+        if rank > self.current[index]:
+            self.current[index] = rank
+            old = self.union[index]
+            if rank > old:
+                self.union[index] = rank
+                self.harmonic += 2.0 ** -rank - 2.0 ** -old
+                if old == 0:
+                    self.zeros -= 1
+
+    def rotate(self):
+        """Start a new window; the previous one stays in the estimate until the next rotation"""
+        previous = self.current
+        self.current = bytearray(len(previous))
+        self.union = bytearray(previous)
+        self.harmonic = sum(2.0 ** -r for r in previous)
+        self.zeros = previous.count(0)
+
+    def estimate(self):
+        """Approximate number of distinct values"""
+        size = len(self.union)
+        alpha = 0.673 if size == 16 else 0.697 if size == 32 else 0.709 if size == 64 else 0.7213 / (1 + 1.079 / size)
+        raw = alpha * size * size / self.harmonic
+        if raw <= 2.5 * size and self.zeros:
+            # Linear counting is more accurate for small cardinalities
+            return size * math.log(size / self.zeros)
+        return raw
+
+class _Rates:
+    """Exponentially decayed packet and byte counts (time constant = window)"""
+    __slots__ = ('last_seen', 'packets', 'bytes')
+
+    def __init__(self, now):
+        self.last_seen = now
+        self.packets = 0.0
+        self.bytes = 0.0
+
+    def decay(self, now, window):
+        factor = math.exp(-(now - self.last_seen) / window) if now > self.last_seen else 1.0
+        self.last_seen = max(now, self.last_seen)
+        return factor
+
+class _SourceState(_Rates):
+    __slots__ = ('squares', 'dests', 'window_start')
+
+    def __init__(self, now):
+        super().__init__(now)
+        self.squares = 0.0
+        self.dests = HyperLogLog()
+        self.window_start = now
+
+class FlowFeatureEngine:
+    """Per-source and per-(source, destination) sliding-window aggregates
+
+    Rates are exponentially decayed counts divided by the window, so no
+    per-packet history is kept. Each table is an LRU (OrderedDict in last-seen
+    order) capped at FLOW_MAX_SOURCES / FLOW_MAX_PAIRS entries; flows idle for
+    longer than FLOW_TTL_SECONDS are evicted from the cold end as traffic
+    arrives. Memory is therefore bounded by the configured number of flows.
+    """
+
+    def __init__(self, window=FLOW_WINDOW_SECONDS, max_sources=FLOW_MAX_SOURCES,
+                 max_pairs=FLOW_MAX_PAIRS, ttl=FLOW_TTL_SECONDS):
+        self.window = window
+        self.max_sources = max_sources
+        self.max_pairs = max_pairs
+        self.ttl = ttl
+        self.sources = OrderedDict()
+        self.pairs = OrderedDict()
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+    def _touch(self, table, key, now, limit, factory):
+        """Fetch a flow's state, creating it and evicting cold flows as needed"""
+        state = table.get(key)
+        if state is None:
+            state = factory(now)
+            table[key] = state
+            # Oldest flows sit at the front; drop expired ones and anything over the cap
+            expire_before = now - self.ttl
+            while table:
+                oldest = next(iter(table.values()))
+                if len(table) > limit or oldest.last_seen < expire_before:
+                    table.popitem(last=False)
+                    self.evicted += 1
+                else:
+                    break
+        else:
+            table.move_to_end(key)
+        return state
+
+    def _update(self, source_ip, dest_ip, packet_size, now):
+        """Account one packet and return its feature tuple"""
+        window = self.window
+        size = float(packet_size)
+
+        source = self._touch(self.sources, source_ip, now, self.max_sources, _SourceState)
+        factor = source.decay(now, window)
+        source.packets = source.packets * factor + 1.0
+        source.bytes = source.bytes * factor + size
+        source.squares = source.squares * factor + size * size
+        if now - source.window_start >= window:
+            source.dests.rotate()
+            source.window_start = now
+        source.dests.add(dest_ip)
+
+        pair = self._touch(self.pairs, (source_ip, dest_ip), now, self.max_pairs, _Rates)
+        factor = pair.decay(now, window)
+        pair.packets = pair.packets * factor + 1.0
+        pair.bytes = pair.bytes * factor + size
+
+        mean = source.bytes / source.packets
+        variance = source.squares / source.packets - mean * mean
+        return (
+            source.packets / window,
+            source.bytes / window,
+            source.dests.estimate(),
+            math.sqrt(variance) if variance > 0 else 0.0,
+            pair.packets / window,
+            pair.bytes / window
+        )
+
+    def update(self, source_ip, dest_ip, packet_size, now=None):
+        """Account one packet and return its features as a tuple"""
+        with self.lock:
+            return self._update(source_ip, dest_ip, packet_size, time.time() if now is None else now)
+
+    def update_batch(self, source_ips, dest_ips, packet_sizes, timestamps=None):
+        """Account packets in order; returns an (n, len(FEATURE_NAMES)) array
+
+        Without timestamps the whole batch is accounted at the current time.
+        """
+        features = np.empty((len(packet_sizes), len(FEATURE_NAMES)), dtype=np.float64)
+        now = time.time()
+        with self.lock:
+            for i, (source_ip, dest_ip, packet_size) in enumerate(zip(source_ips, dest_ips, packet_sizes)):
+                features[i] = self._update(source_ip, dest_ip, packet_size,
+                                           now if timestamps is None else timestamps[i])
+        return features
+
+    def stats(self):
+        """Table sizes and evictions, for monitoring"""
+        with self.lock:
+            return {'sources': len(self.sources), 'pairs': len(self.pairs), 'evicted': self.evicted}
@@ -0,0 +1,205 @@
+# ml/model_registry.py
+import contextlib
+import fcntl
+import json
+import os
+import pickle
+import re
+import tempfile
+import sys
+sys.path.append('..')
+from utils.config import MODEL_DIR, MODEL_KEEP_VERSIONS
+
+_VERSION_FILE = re.compile(r'^model-v(\d+)\.pkl$')
+FINISHED_STATUSES = ('succeeded', 'failed', 'superseded')  # Job statuses after which a job no longer holds its claim
+
+
+def atomic_write(path, data):
+    """Write bytes so readers see either the old file or the complete new one"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ModelRegistry:
+    """Versioned model artifacts with an atomically switched CURRENT pointer
+
+    Layout of MODEL_DIR:
+        model-v000001.pkl, model-v000002.pkl, ...   immutable versions
+        model-v000001.npz, ...                       compiled forest of each version
+        CURRENT                                      version number in use
+        jobs/<job_id>.json                           retraining and rescoring job status
+        jobs/<name>.lock                             job currently claiming the `name` slot
+    """
+
+    def __init__(self, directory=MODEL_DIR):
+        self.directory = directory
+        self.jobs_directory = os.path.join(directory, 'jobs')
+
+    def path(self, version):
+        """Artifact path of a version"""
+        return os.path.join(self.directory, f"model-v{version:06d}.pkl")
+
+    def compiled_path(self, version):
+        """Compiled forest path of a version"""
+        return os.path.join(self.directory, f"model-v{version:06d}.npz")
+
+    def versions(self):
+        """All published versions, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = (_VERSION_FILE.match(name) for name in os.listdir(self.directory))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    def current_version(self):
+        """Version CURRENT points to, or None before the first publish"""
+        try:
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set_current(self, version):
+        """Atomically point CURRENT at an existing version"""
+        if not os.path.exists(self.path(version)):
+            raise ValueError(f"Model version {version} does not exist")
+        atomic_write(os.path.join(self.directory, 'CURRENT'), f"{version}\n".encode())
+
+    def publish(self, model):
+        """Store a fitted model as the next version and make it current"""
+        from ml.compiled_forest import export_forest
+
+        os.makedirs(self.directory, exist_ok=True)
+        data = pickle.dumps(model)
+
+        # O_EXCL claims the version number even if two trainers publish at once
+        version = (self.versions() or [0])[-1] + 1
+        while True:
+            try:
+                os.close(os.open(self.path(version), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                version += 1
+
+        # The compiled forest is written first so it exists once the version is visible
+        try:
+            atomic_write(self.compiled_path(version), export_forest(model))
+            atomic_write(self.path(version), data)
+        except Exception:
+            # Left behind, the empty placeholder would list (and roll back) as a real version
+            for path in (self.compiled_path(version), self.path(version)):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        self.set_current(version)
+        self.prune()
+        return version
+
+    def load(self, version, compiled=False):
+        """Unpickle a version, or load its compiled forest if `compiled` is set"""
+        from ml.compiled_forest import CompiledForest, export_forest
+
+        if compiled:
+            if not os.path.exists(self.compiled_path(version)):
+                # Versions published before compiled export get their .npz on first use
+                atomic_write(self.compiled_path(version), export_forest(self.load(version)))
+            return CompiledForest.load(self.compiled_path(version))
+        with open(self.path(version), 'rb') as f:
+            return pickle.load(f)
+
+    def rollback(self):
+        """Point CURRENT at the newest version older than the current one"""
+        current = self.current_version()
+        older = [v for v in self.versions() if current is None or v < current]
+        if not older:
+            raise ValueError("No earlier model version to roll back to")
+        self.set_current(older[-1])
+        return older[-1]
+
+    def prune(self, keep=MODEL_KEEP_VERSIONS):
+        """Delete the oldest versions beyond `keep`, never the current one"""
+        current = self.current_version()
+        for version in self.versions()[:-keep]:
+            if version != current:
+                os.remove(self.path(version))
+                if os.path.exists(self.compiled_path(version)):
+                    os.remove(self.compiled_path(version))
+
+    def write_job(self, job_id, **fields):
+        """Create or update a job status record"""
+        os.makedirs(self.jobs_directory, exist_ok=True)
+        record = self.read_job(job_id) or {'job_id': job_id}
+        record.update(fields)
+        atomic_write(os.path.join(self.jobs_directory, f"{job_id}.json"), json.dumps(record).encode())
+        return record
+
+    def read_job(self, job_id):
+        """Job status record, or None if unknown"""
+        try:
+            with open(os.path.join(self.jobs_directory, f"{os.path.basename(job_id)}.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def claim(self, name, job_id):
+        """Make job_id the one `name` job across all processes; returns the job holding it instead, or None
+
+        The claim file is read and written under an exclusive flock. A claim
+        whose job has finished, or whose process has died, is taken over.
+        """
+        path = os.path.join(self.jobs_directory, f"{name}.lock")
+        with self._claims_locked():
+            try:
+                with open(path) as f:
+                    holder = json.load(f)
+            except (FileNotFoundError, ValueError):
+                holder = None
+            if holder is not None:
+                job = self.read_job(holder['job_id'])
+                if job_alive(job, holder['pid']):
+                    return job or {'job_id': holder['job_id'], 'status': 'queued'}
+            atomic_write(path, json.dumps({'job_id': job_id, 'pid': os.getpid()}).encode())
+        return None
+
+    def release(self, name, job_id):
+        """Drop job_id's claim on `name`, if it still holds it"""
+        path = os.path.join(self.jobs_directory, f"{name}.lock")
+        with self._claims_locked():
+            try:
+                with open(path) as f:
+                    holder = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return
+            if holder['job_id'] == job_id:
+                os.remove(path)
+
+    @contextlib.contextmanager
+    def _claims_locked(self):
+        os.makedirs(self.jobs_directory, exist_ok=True)
+        with open(os.path.join(self.jobs_directory, '.claims'), 'a') as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            yield
+
+
+def job_alive(job, pid):
+    """Whether a claimed job may still be running: not finished, and its process (or the claimer's) exists"""
+    if job is not None:
+        if job.get('status') in FINISHED_STATUSES:
+            return False
+        pid = job.get('pid', pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
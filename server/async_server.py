@@ -0,0 +1,172 @@
+# server/async_server.py
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import sys
+sys.path.append('..')
+from utils.config import USE_UVLOOP, LISTEN_BACKLOG, EXECUTOR_WORKERS, RECV_BUFFER_SIZE
+from utils.protocol import MAGIC, ENCODING_JSON, ENCODING_BINARY, HELLO_SIZE, FrameDecoder, RecordDecoder, encode_ack
+from server import NetSentinelServer, RECEIVED_JSON, RECEIVED_BINARY, RECEIVED_LEGACY, INVALID_LEGACY
+
+class AsyncNetSentinelServer(NetSentinelServer):
+    """Single event loop server; scoring and DB writes run in a thread pool"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.server = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=EXECUTOR_WORKERS,
+            thread_name_prefix='netsentinel-worker'
+        )
+
+    def start(self):
+        """Start the server"""
+        if USE_UVLOOP:
+            try:
+                import uvloop
+                uvloop.install()
+                print("⚡ Using uvloop event loop")
+            except ImportError:
+                print("⚠️ uvloop not installed, falling back to asyncio")
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\n⏹️ Server shutting down...")
+        except Exception as e:
+            print(f"❌ Server error: {e}")
+        finally:
+            self.shutdown()
+
+    async def serve(self):
+        """Accept connections until cancelled"""
+        self.server = await asyncio.start_server(
+            self.handle_client_async,
+            self.host,
+            self.port,
+            backlog=LISTEN_BACKLOG,
+            reuse_port=self.reuse_port or None
+        )
+
+        print(f"🚀 NetSentinel async server started on {self.host}:{self.port}")
+        print(f"📡 Listening for connections... (Backlog: {LISTEN_BACKLOG}, Workers: {EXECUTOR_WORKERS})")
+
+        self.start_metrics()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_client_async(self, reader, writer):
+        """Handle individual client connection"""
+        address = writer.get_extra_info('peername')
+        self.active_connections += 1
+        print(f"✅ New connection from {address} (Active: {self.active_connections})")
+
+        try:
+            data = await self.read_preamble_async(reader)
+
+            if data.startswith(MAGIC):
+                encoding = data[len(MAGIC)]
+                if encoding == ENCODING_JSON:
+                    await self.handle_framed_async(reader, writer, address, data[HELLO_SIZE:])
+                elif encoding == ENCODING_BINARY:
+                    await self.handle_binary_async(reader, writer, address, data[HELLO_SIZE:])
+                else:
+                    print(f"⚠️ Unsupported encoding {encoding} from {address}")
+            else:
+                await self.handle_legacy_async(reader, writer, address, data)
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"❌ Error handling client {address}: {e}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            self.active_connections -= 1
+            print(f"❌ Connection closed from {address} (Active: {self.active_connections})")
+
+    async def read_preamble_async(self, reader):
+        """Read enough bytes to tell a framed client from a legacy one"""
+        data = b''
+        while len(data) < HELLO_SIZE and MAGIC.startswith(data[:len(MAGIC)]):
+            chunk = await reader.read(RECV_BUFFER_SIZE)
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    async def handle_legacy_async(self, reader, writer, address, data):
+        """Legacy mode: one JSON packet per read, one ack per packet"""
+        loop = asyncio.get_running_loop()
+        while data:
+            try:
+                packet = json.loads(data.decode('utf-8'))
+                RECEIVED_LEGACY.inc()
+                await loop.run_in_executor(self.executor, self.submit_packet, packet, address)
+
+                response = {"status": "received", "packet_id": packet.get('id', 'unknown')}
+                writer.write(json.dumps(response).encode('utf-8'))
+                await writer.drain()
+
+            except ValueError as e:
+                # JSONDecodeError and UnicodeDecodeError included
+                INVALID_LEGACY.inc()
+                print(f"⚠️ Invalid JSON from {address}: {e}")
+
+            data = await reader.read(1024)
+
+    async def handle_framed_async(self, reader, writer, address, data):
+        """Framed mode: each read is decoded and processed as one executor job"""
+        loop = asyncio.get_running_loop()
+        decoder = FrameDecoder()
+        received = 0
+
+        while True:
+            payloads = decoder.feed(data)
+            if payloads:
+                # Awaiting the hand-off stops reading from a client while the
+                # pipeline is full, so backpressure reaches it over TCP
+                await loop.run_in_executor(self.executor, self.process_frames, payloads, address)
+                received += len(payloads)
+                writer.write(encode_ack(received))
+                await writer.drain()
+
+            data = await reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                break
+
+    async def handle_binary_async(self, reader, writer, address, data):
+        """Binary mode: each read's records are converted and submitted as one executor job"""
+        loop = asyncio.get_running_loop()
+        decoder = RecordDecoder()
+        received = 0
+
+        while True:
+            records = decoder.feed(data)
+            if len(records):
+                await loop.run_in_executor(self.executor, self.process_records, records, address)
+                received += len(records)
+                writer.write(encode_ack(received))
+                await writer.drain()
+
+            data = await reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                break
+
+    def process_records(self, records, address):
+        """Hand a run of binary records to the pipeline (executor thread; may block when it is full)"""
+        RECEIVED_BINARY.inc(len(records))
+        self.submit_records(records, address)
+
+    def process_frames(self, payloads, address):
+        """Hand a run of JSON frames to the pipeline (executor thread; may block when it is full)"""
+        RECEIVED_JSON.inc(len(payloads))
+        self.submit_frames(payloads, address)
+
+    def shutdown(self):
+        """Shutdown the server gracefully"""
+        self.executor.shutdown(wait=True)
+        super().shutdown()
@@ -0,0 +1,157 @@
+# server/launcher.py
+# Runs several ingestion workers on the same port (SO_REUSEPORT) under a supervisor
+import multiprocessing
+import signal
+import threading
+import time
+import sys
+sys.path.append('..')
+from utils.config import SERVER_PORT, WORKER_PROCESSES, WORKER_RESTART_DELAY, WORKER_STATS_INTERVAL, METRICS_PORT
+from utils import metrics
+from server import create_server
+
+# Per-worker slots in the shared array: cumulative counters, then gauges
+COUNTERS = ('packets', 'anomalies')
+GAUGES = ('connections',)
+SLOTS = COUNTERS + GAUGES
+COUNTER_REFRESH = 0.5  # Seconds between worker counter publications
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run_worker(index, counters, server_factory):
+    """Worker process: own server, model and DB pool; publish counters to shared memory"""
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    # Each worker serves its own detailed metrics; the supervisor serves the totals on METRICS_PORT
+    server = server_factory(reuse_port=True, metrics_port=METRICS_PORT + 1 + index if METRICS_PORT else None)
+    base = index * len(SLOTS)
+
+    def publish():
+        while True:
+            counters[base] = server.packets_processed
+            counters[base + 1] = server.anomalies_detected
+            counters[base + 2] = server.active_connections
+            time.sleep(COUNTER_REFRESH)
+
+    threading.Thread(target=publish, name='counter-publisher', daemon=True).start()
+    server.start()
+
+class WorkerSupervisor:
+    """Start N workers, restart the ones that crash and report aggregate counters"""
+
+    def __init__(self, num_workers=WORKER_PROCESSES, server_factory=create_server):
+        self.num_workers = num_workers
+        self.server_factory = server_factory
+        self.counters = multiprocessing.Array('q', num_workers * len(SLOTS), lock=False)
+        # Counter totals from previous incarnations of each worker, kept across restarts
+        self.carried = [[0] * len(COUNTERS) for _ in range(num_workers)]
+        self.workers = [None] * num_workers
+        self.restarts = 0
+        self.running = False
+
+    def spawn(self, index):
+        """Start (or restart) the worker in slot `index`"""
+        base = index * len(SLOTS)
+        for k in range(len(COUNTERS)):
+            self.carried[index][k] += self.counters[base + k]
+        for k in range(len(SLOTS)):
+            self.counters[base + k] = 0
+
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(index, self.counters, self.server_factory),
+            name=f'netsentinel-worker-{index}',
+            daemon=True
+        )
+        process.start()
+        self.workers[index] = process
+
+    def totals(self):
+        """Aggregate counters across all workers, including restarted ones"""
+        totals = dict.fromkeys(SLOTS, 0)
+        for index in range(self.num_workers):
+            base = index * len(SLOTS)
+            for k, name in enumerate(SLOTS):
+                totals[name] += self.counters[base + k]
+            for k, name in enumerate(COUNTERS):
+                totals[name] += self.carried[index][k]
+        return totals
+
+    def start_workers(self):
+        """Start every worker without blocking"""
+        self.running = True
+        for index in range(self.num_workers):
+            self.spawn(index)
+        print(f"🚀 Supervisor started {self.num_workers} workers on port {SERVER_PORT}")
+
+    def serve_metrics(self):
+        """Expose aggregate worker counters on METRICS_PORT"""
+        workers = metrics.gauge('netsentinel_workers_alive', 'Ingestion worker processes currently running')
+        workers.set_function(lambda: sum(1 for p in self.workers if p and p.is_alive()))
+        metrics.gauge('netsentinel_worker_restarts', 'Worker processes restarted since startup').set_function(
+            lambda: self.restarts
+        )
+        totals = metrics.gauge('netsentinel_supervisor_total', 'Counters summed over all workers', ['counter'])
+        for name in SLOTS:
+            totals.labels(name).set_function(lambda name=name: self.totals()[name])
+        try:
+            metrics.start_metrics_server(METRICS_PORT)
+            print(f"📊 Aggregate metrics on port {METRICS_PORT}, worker metrics on {METRICS_PORT + 1}..{METRICS_PORT + self.num_workers}")
+        except OSError as e:
+            print(f"⚠️ Could not serve metrics on port {METRICS_PORT}: {e}")
+
+    def start(self):
+        """Start every worker and supervise until interrupted"""
+        self.start_workers()
+        if METRICS_PORT:
+            self.serve_metrics()
+        try:
+            self.supervise()
+        except KeyboardInterrupt:
+            print("\n⏹️ Supervisor shutting down...")
+        finally:
+            self.shutdown()
+
+    def supervise(self, duration=None):
+        """Restart dead workers and print throughput every WORKER_STATS_INTERVAL seconds"""
+        started = time.monotonic()
+        last_report = started
+        last_packets = self.totals()['packets']
+
+        while self.running:
+            time.sleep(WORKER_RESTART_DELAY)
+
+            for index, process in enumerate(self.workers):
+                if not process.is_alive():
+                    print(f"⚠️ Worker {index} exited with code {process.exitcode}, restarting")
+                    self.restarts += 1
+                    self.spawn(index)
+
+            now = time.monotonic()
+            if now - last_report >= WORKER_STATS_INTERVAL:
+                totals = self.totals()
+                rate = (totals['packets'] - last_packets) / (now - last_report)
+                print(f"📊 {totals['packets']} packets | {totals['anomalies']} anomalies | "
+                      f"{totals['connections']} connections | {rate:.0f} pkt/s | {self.restarts} restarts")
+                last_report, last_packets = now, totals['packets']
+
+            if duration is not None and now - started >= duration:
+                break
+
+    def shutdown(self, timeout=10):
+        """Ask every worker to flush and exit, then force-stop stragglers"""
+        self.running = False
+        for process in self.workers:
+            if process and process.is_alive():
+                process.terminate()
+        for process in self.workers:
+            if process:
+                process.join(timeout)
+                if process.is_alive():
+                    process.kill()
+        print(f"✅ Supervisor stopped ({self.totals()['packets']} packets processed)")
+
+if __name__ == "__main__":
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKER_PROCESSES
+    supervisor = WorkerSupervisor(num_workers)
+    supervisor.start()
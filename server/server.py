@@ -2,29 +2,132 @@
 import socket
 import threading
 import json
+import os
+import time
 import sys
 sys.path.append('..')
-from utils.config import SERVER_HOST, SERVER_PORT, MAX_CONNECTIONS
+from utils.config import (SERVER_HOST, SERVER_PORT, MAX_CONNECTIONS, SERVER_MODE, ACK_EVERY, RECV_BUFFER_SIZE,
+                          BATCH_SCORING, WRITE_BEHIND, METRICS_PORT, PIPELINE_POLICY, DECODE_WORKERS,
+                          SCORE_WORKERS, PERSIST_WORKERS, DECODE_QUEUE_SIZE, SCORE_QUEUE_SIZE, PERSIST_QUEUE_SIZE,
+                          PERSIST_BATCH_SIZE, PERSIST_MAX_WAIT_MS, EXECUTOR_WORKERS, HEAVY_HITTERS, LIVE_FEED,
+                          TOP_PUBLISH_INTERVAL, PROTOCOLS)
+from utils.protocol import (MAGIC, ENCODING_JSON, ENCODING_BINARY, HELLO_SIZE, MAX_PACKET_SIZE, FrameDecoder,
+                            RecordDecoder, encode_ack, records_to_rows)
+from utils import metrics
+from utils.packet_log import PacketLog
 from database.db import Database
 from ml.anomaly_model import AnomalyDetector
+from batcher import MicroBatcher
+from traffic import TrafficMonitor
+
+packets_received = metrics.counter('netsentinel_packets_received_total', 'Packets received from clients', ['encoding'])
+packets_scored = metrics.counter('netsentinel_packets_scored_total', 'Packets scored by the model')
+anomalies_detected = metrics.counter('netsentinel_anomalies_total', 'Packets flagged as anomalous')
+packets_stored = metrics.counter('netsentinel_packets_stored_total', 'Packets accepted by the database layer')
+stage_seconds = metrics.histogram('netsentinel_stage_seconds', 'Time per call of each pipeline stage', ['stage'])
+batch_sizes = metrics.histogram('netsentinel_batch_size', 'Packets per scoring batch',
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+active_connections = metrics.gauge('netsentinel_active_connections', 'Open client connections')
+packets_invalid = metrics.counter('netsentinel_packets_invalid_total', 'Malformed packets skipped, by where they were caught',
+                                  ['stage'])
+
+# Fields every JSON packet must carry
+PACKET_FIELDS = ('source_ip', 'dest_ip', 'packet_size', 'protocol')
+KNOWN_PROTOCOLS = frozenset(PROTOCOLS)
+
+# Queue-full behaviour of each stage under PIPELINE_POLICY. Shedding happens where
+# packets enter the pipeline, so no work is spent on packets that are then dropped.
+STAGE_POLICIES = {
+    'block': {'decode': 'block', 'score': 'block', 'persist': 'block'},
+    'drop': {'decode': 'drop', 'score': 'drop', 'persist': 'block'},
+    'skip_persist': {'decode': 'block', 'score': 'block', 'persist': 'drop'}
+}
+
+# Children resolved once; labels() is not free on the hot path
+RECEIVED_JSON = packets_received.labels('json')
+RECEIVED_BINARY = packets_received.labels('binary')
+RECEIVED_LEGACY = packets_received.labels('legacy')
+INVALID_DECODE = packets_invalid.labels('decode')
+INVALID_LEGACY = packets_invalid.labels('legacy')
+PARSE_SECONDS = stage_seconds.labels('parse')
+SCORE_SECONDS = stage_seconds.labels('score')
+INSERT_SECONDS = stage_seconds.labels('insert')
+
+def db_pool_size():
+    """Connections this process writes with at once, plus one each for partition maintenance and top talkers"""
+    if BATCH_SCORING:
+        writers = PERSIST_WORKERS
+    elif WRITE_BEHIND:
+        writers = 1
+    else:
+        # Inline writes come from executor threads (asyncio) or client threads (threaded),
+        # which then share EXECUTOR_WORKERS connections and wait up to DB_POOL_TIMEOUT
+        writers = EXECUTOR_WORKERS
+    return writers + 1 + (1 if HEAVY_HITTERS else 0)
 
 class NetSentinelServer:
-    def __init__(self):
+    def __init__(self, db=None, ml_model=None, reuse_port=False, metrics_port=METRICS_PORT):
         self.host = SERVER_HOST
         self.port = SERVER_PORT
+        self.reuse_port = reuse_port
         self.server_socket = None
-        self.db = Database()
-        self.ml_model = AnomalyDetector()
+        # The pipeline's persist stage batches writes itself
+        self.db = db if db is not None else Database(write_behind=WRITE_BEHIND and not BATCH_SCORING, maintenance=True,
+                                                     pool_size=db_pool_size())
+        # An empty model registry does not hold up startup: the first model is built in the background
+        self.ml_model = ml_model if ml_model is not None else AnomalyDetector(watch=True, background=True)
         self.active_connections = 0
+        self.packets_processed = 0
+        self.anomalies_detected = 0
         self.lock = threading.Lock()
+        self.packet_log = PacketLog()
+        self.metrics_port = metrics_port
+        # Top talkers and per-source limits, applied before packets enter scoring
+        self.traffic = TrafficMonitor() if HEAVY_HITTERS else None
+        self.publisher_id = f"{socket.gethostname()}:{os.getpid()}"
+        # receive (connection threads) -> decode -> score -> persist, joined by bounded queues
+        self.stages = []
+        self.decode_stage = self.score_stage = self.persist_stage = None
+        if BATCH_SCORING:
+            policies = STAGE_POLICIES[PIPELINE_POLICY]
+            # Keyed by connection: one worker decodes all of a connection's buffers, in order
+            self.decode_stage = MicroBatcher(self.decode_batch, max_size=16, max_wait_ms=0, name='decode',
+                                             workers=DECODE_WORKERS, maxsize=DECODE_QUEUE_SIZE,
+                                             policy=policies['decode'], keyed=True)
+            self.score_stage = MicroBatcher(self.process_batch, name='score', workers=SCORE_WORKERS,
+                                            maxsize=SCORE_QUEUE_SIZE, policy=policies['score'])
+            self.persist_stage = MicroBatcher(self.persist_batch, max_size=PERSIST_BATCH_SIZE,
+                                              max_wait_ms=PERSIST_MAX_WAIT_MS, name='persist',
+                                              workers=PERSIST_WORKERS, maxsize=PERSIST_QUEUE_SIZE,
+                                              policy=policies['persist'])
+            self.stages = [self.decode_stage, self.score_stage, self.persist_stage]
+            for stage in self.stages:
+                stage.start()
+        if self.traffic:
+            threading.Thread(target=self.traffic_loop, name='top-talkers', daemon=True).start()
+        active_connections.set_function(lambda: self.active_connections)
+
+    def start_metrics(self):
+        """Serve /metrics on metrics_port, if configured"""
+        if not self.metrics_port:
+            return
+        try:
+            metrics.start_metrics_server(self.metrics_port)
+            print(f"📊 Metrics on http://{self.host}:{self.metrics_port}/metrics")
+        except OSError as e:
+            print(f"⚠️ Could not serve metrics on port {self.metrics_port}: {e}")
 
     def start(self):
         """Start the server"""
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                # Lets several worker processes bind the same port; the kernel balances connections
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.server_socket.bind((self.host, self.port))
             self.server_socket.listen(MAX_CONNECTIONS)
+            self.start_metrics()
             
             print(f"🚀 NetSentinel Server started on {self.host}:{self.port}")
             print(f"📡 Listening for connections... (Max: {MAX_CONNECTIONS})")
@@ -55,25 +158,19 @@ class NetSentinelServer:
     def handle_client(self, client_socket, address):
         """Handle individual client connection"""
         try:
-            while True:
-                # Receive data from client
-                data = client_socket.recv(1024).decode('utf-8')
-                
-                if not data:
-                    break
-                
-                # Parse packet data
-                try:
-                    packet = json.loads(data)
-                    self.process_packet(packet, address)
-                    
-                    # Send acknowledgment
-                    response = {"status": "received", "packet_id": packet.get('id', 'unknown')}
-                    client_socket.send(json.dumps(response).encode('utf-8'))
-                    
-                except json.JSONDecodeError:
-                    print(f"⚠️ Invalid JSON from {address}")
-                    
+            data = self.read_preamble(client_socket)
+
+            if data.startswith(MAGIC):
+                encoding = data[len(MAGIC)]
+                if encoding == ENCODING_JSON:
+                    self.handle_framed(client_socket, address, data[HELLO_SIZE:])
+                elif encoding == ENCODING_BINARY:
+                    self.handle_binary(client_socket, address, data[HELLO_SIZE:])
+                else:
+                    print(f"⚠️ Unsupported encoding {encoding} from {address}")
+            else:
+                self.handle_legacy(client_socket, address, data)
+
         except Exception as e:
             print(f"❌ Error handling client {address}: {e}")
         finally:
@@ -82,38 +179,284 @@ class NetSentinelServer:
                 self.active_connections -= 1
             print(f"❌ Connection closed from {address} (Active: {self.active_connections})")
 
+    def read_preamble(self, client_socket):
+        """Read enough bytes to tell a framed client from a legacy one"""
+        data = b''
+        while len(data) < HELLO_SIZE and MAGIC.startswith(data[:len(MAGIC)]):
+            chunk = client_socket.recv(RECV_BUFFER_SIZE)
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def handle_legacy(self, client_socket, address, data):
+        """Legacy mode: one JSON packet per recv, one ack per packet"""
+        while data:
+            # Parse packet data
+            try:
+                start = time.perf_counter()
+                packet = json.loads(data.decode('utf-8'))
+                PARSE_SECONDS.observe(time.perf_counter() - start)
+                RECEIVED_LEGACY.inc()
+                self.submit_packet(packet, address)
+
+                # Send acknowledgment
+                response = {"status": "received", "packet_id": packet.get('id', 'unknown')}
+                client_socket.send(json.dumps(response).encode('utf-8'))
+
+            except ValueError as e:
+                # JSONDecodeError and UnicodeDecodeError included
+                INVALID_LEGACY.inc()
+                print(f"⚠️ Invalid JSON from {address}: {e}")
+
+            # Receive data from client
+            data = client_socket.recv(1024)
+
+    def handle_framed(self, client_socket, address, data):
+        """Framed mode: length-prefixed packets with batched acks"""
+        decoder = FrameDecoder()
+        received = 0
+
+        while True:
+            payloads = decoder.feed(data)
+            RECEIVED_JSON.inc(len(payloads))
+
+            # Frames are handed on ACK_EVERY at a time and acked once accepted;
+            # a blocked hand-off stops this thread reading, which backs up TCP
+            for start in range(0, len(payloads), ACK_EVERY):
+                chunk = payloads[start:start + ACK_EVERY]
+                self.submit_frames(chunk, address)
+                received += len(chunk)
+                client_socket.sendall(encode_ack(received))
+
+            data = client_socket.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+
+    def handle_binary(self, client_socket, address, data):
+        """Binary mode: fixed-size records decoded a receive buffer at a time"""
+        decoder = RecordDecoder()
+        received = 0
+
+        while True:
+            records = decoder.feed(data)
+            if len(records):
+                RECEIVED_BINARY.inc(len(records))
+                self.submit_records(records, address)
+                received += len(records)
+                client_socket.sendall(encode_ack(received))
+
+            data = client_socket.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+
+    def submit_frames(self, payloads, address):
+        """Hand received JSON frames to the decode stage, or decode them inline"""
+        if self.decode_stage:
+            self.decode_stage.submit((ENCODING_JSON, payloads, address), len(payloads), key=address)
+        else:
+            self.submit_rows(self.decode_frames(payloads, address))
+
+    def submit_records(self, records, address=None):
+        """Hand received binary records to the decode stage, or decode them inline"""
+        if self.decode_stage:
+            self.decode_stage.submit((ENCODING_BINARY, records, address), len(records), key=address)
+        else:
+            self.submit_rows(self.decode_records(records))
+
+    def submit_packet(self, packet, address):
+        """Hand a decoded packet to the score stage, or process it inline"""
+        self.submit_rows([self.parse_packet(packet, address)])
+
+    def submit_rows(self, rows):
+        """Hand parsed (source_ip, dest_ip, packet_size, protocol) rows on in order
+
+        Each connection's buffers are decoded by one worker, so its rows arrive
+        here in the order they were received; rows of different connections
+        interleave. With one score worker they are also scored in that order.
+        """
+        if self.traffic:
+            rows = self.traffic.admit(rows)
+        if self.score_stage:
+            for row in rows:
+                self.score_stage.submit(row)
+        else:
+            for row in rows:
+                self.process_row(row)
+
+    def decode_frames(self, payloads, address):
+        """JSON frame payloads -> parsed rows; invalid frames are counted and skipped"""
+        start = time.perf_counter()
+        rows = []
+        for payload in payloads:
+            # One bad frame must not cost the rest of the batch, which is already acked
+            try:
+                rows.append(self.parse_packet(json.loads(payload), address))
+            except (AttributeError, TypeError, ValueError) as e:
+                INVALID_DECODE.inc()
+                print(f"⚠️ Invalid JSON frame from {address}: {e}")
+        PARSE_SECONDS.observe(time.perf_counter() - start)
+        return rows
+
+    def decode_records(self, records):
+        """Binary records -> parsed rows, counting the records records_to_rows rejects"""
+        start = time.perf_counter()
+        rows = records_to_rows(records)
+        PARSE_SECONDS.observe(time.perf_counter() - start)
+        if len(rows) < len(records):
+            INVALID_DECODE.inc(len(records) - len(rows))
+        return rows
+
+    def decode_batch(self, items):
+        """Decode stage: turn received buffers into rows for the score stage"""
+        for encoding, data, address in items:
+            if encoding == ENCODING_BINARY:
+                self.submit_rows(self.decode_records(data))
+            else:
+                self.submit_rows(self.decode_frames(data, address))
+
+    def parse_packet(self, packet, address):
+        """Extract the stored fields from a packet dict; ValueError if it is not a complete packet"""
+        if not isinstance(packet, dict):
+            raise ValueError(f"expected a JSON object, got {type(packet).__name__}")
+        missing = [field for field in PACKET_FIELDS if field not in packet]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        source_ip, dest_ip, packet_size, protocol = (packet[field] for field in PACKET_FIELDS)
+        if not (isinstance(source_ip, str) and isinstance(dest_ip, str) and isinstance(protocol, str)):
+            raise ValueError("source_ip, dest_ip and protocol must be strings")
+        # One bad row would fail the whole batch's COPY into the VARCHAR columns
+        for ip in (source_ip, dest_ip):
+            try:
+                socket.inet_pton(socket.AF_INET, ip)
+            except (OSError, ValueError):
+                raise ValueError(f"expected a dotted IPv4 address, got {ip[:32]!r}") from None
+        if protocol not in KNOWN_PROTOCOLS:
+            raise ValueError(f"unknown protocol {protocol[:32]!r}")
+        # bool is an int subclass; NaN fails the range check
+        if isinstance(packet_size, bool) or not isinstance(packet_size, (int, float)) \
+                or not 0 <= packet_size <= MAX_PACKET_SIZE:
+            raise ValueError(f"packet_size must be a number from 0 to {MAX_PACKET_SIZE}, got {packet_size!r}")
+        return source_ip, dest_ip, int(packet_size), protocol
+
     def process_packet(self, packet, address):
         """Process received packet using FCFS scheduling"""
+        self.process_row(self.parse_packet(packet, address))
+
+    def process_row(self, row):
+        """Score, store and log one parsed packet"""
         try:
-            source_ip = packet.get('source_ip', str(address[0]))
-            dest_ip = packet.get('dest_ip', 'unknown')
-            packet_size = packet.get('packet_size', 0)
-            protocol = packet.get('protocol', 'TCP')
+            source_ip, dest_ip, packet_size, protocol = row
             
             # ML anomaly detection
-            is_anomaly = self.ml_model.predict(packet_size, protocol)
+            with SCORE_SECONDS.time():
+                is_anomaly = self.ml_model.predict(packet_size, protocol, source_ip, dest_ip)
             
             # Convert numpy bool to Python bool for PostgreSQL
             is_anomaly = bool(is_anomaly)
+            packets_scored.inc()
+            anomalies_detected.inc(is_anomaly)
             
             # Store in database
-            self.db.insert_packet(source_ip, dest_ip, packet_size, protocol, is_anomaly)
+            with INSERT_SECONDS.time():
+                stored = self.db.insert_packet(source_ip, dest_ip, packet_size, protocol, is_anomaly,
+                                               self.ml_model.model_version)
+            if stored:
+                packets_stored.inc()
+            
+            with self.lock:
+                self.packets_processed += 1
+                self.anomalies_detected += is_anomaly
             
             # Log the packet
-            status = "🚨 ANOMALY" if is_anomaly else "✅ NORMAL"
-            print(f"{status} | {source_ip} → {dest_ip} | {packet_size}B | {protocol}")
+            self.log_packet(source_ip, dest_ip, packet_size, protocol, is_anomaly)
             
         except Exception as e:
             print(f"❌ Error processing packet: {e}")
 
+    def process_batch(self, rows):
+        """Score stage: one model call per micro-batch, then hand rows to the persist stage"""
+        try:
+            batch_sizes.observe(len(rows))
+            
+            # ML anomaly detection for the whole batch
+            with SCORE_SECONDS.time():
+                flags = self.ml_model.predict_batch(
+                    [row[2] for row in rows],
+                    [row[3] for row in rows],
+                    [row[0] for row in rows],
+                    [row[1] for row in rows]
+                )
+            anomalies = int(flags.sum())
+            packets_scored.inc(len(rows))
+            anomalies_detected.inc(anomalies)
+            
+            # tolist() yields Python bools for PostgreSQL
+            rows = [(*row, is_anomaly) for row, is_anomaly in zip(rows, flags.tolist())]
+            
+            for row in rows:
+                self.persist_stage.submit(row)
+            
+            with self.lock:
+                self.packets_processed += len(rows)
+                self.anomalies_detected += anomalies
+            
+            for source_ip, dest_ip, packet_size, protocol, is_anomaly in rows:
+                self.log_packet(source_ip, dest_ip, packet_size, protocol, is_anomaly)
+                
+        except Exception as e:
+            print(f"❌ Error processing batch: {e}")
+
+    def persist_batch(self, rows):
+        """Persist stage: store scored rows in one bulk write, tagged with the current model version"""
+        with INSERT_SECONDS.time():
+            stored = self.db.insert_packets(rows, self.ml_model.model_version)
+        if stored:
+            packets_stored.inc(len(rows))
+
+    def traffic_loop(self):
+        """Publish top talkers and store rate-limit summaries every TOP_PUBLISH_INTERVAL seconds"""
+        while True:
+            time.sleep(TOP_PUBLISH_INTERVAL)
+            self.publish_traffic()
+
+    def publish_traffic(self):
+        """Send a top-talker snapshot to API processes and store summarized excess traffic"""
+        try:
+            if LIVE_FEED:
+                snapshot = self.traffic.snapshot()
+                snapshot['server'] = self.publisher_id
+                self.db.publish_top(snapshot)
+            limited = self.traffic.take_limited()
+            if limited:
+                self.db.record_rate_limited(limited)
+        except Exception as e:
+            print(f"⚠️ Error publishing top talkers: {e}")
+
+    def log_packet(self, source_ip, dest_ip, packet_size, protocol, is_anomaly):
+        """Sampled, rate-limited structured log line (off unless LOG_PACKETS is set)"""
+        self.packet_log.log(source_ip, dest_ip, packet_size, protocol, is_anomaly)
+
     def shutdown(self):
         """Shutdown the server gracefully"""
+        # Upstream first, so each stage flushes into one that is still running
+        for stage in self.stages:
+            stage.stop()
+        if self.traffic:
+            self.publish_traffic()
         if self.server_socket:
             self.server_socket.close()
         if self.db:
             self.db.close()
         print("✅ Server shutdown complete")
 
+def create_server(**kwargs):
+    """Build the server implementation selected by SERVER_MODE"""
+    if SERVER_MODE == 'asyncio':
+        from async_server import AsyncNetSentinelServer
+        return AsyncNetSentinelServer(**kwargs)
+    return NetSentinelServer(**kwargs)
+
 if __name__ == "__main__":
-    server = NetSentinelServer()
+    server = create_server()
     server.start()
\ No newline at end of file
@@ -0,0 +1,257 @@
+# server/traffic.py
+# Who is sending the most, in bounded memory, and per-source rate limits applied
+# before packets are scored or stored.
+import heapq
+import threading
+import time
+from collections import OrderedDict
+import sys
+sys.path.append('..')
+from utils.config import (HEAVY_HITTER_CAPACITY, HEAVY_HITTER_WINDOW, TOP_PUBLISH_SIZE, RATE_LIMIT_PER_SOURCE,
+                          RATE_LIMIT_BURST, RATE_LIMIT_OVERRIDES, RATE_LIMIT_MAX_SOURCES, RATE_LIMIT_POLICY)
+from utils import metrics
+
+packets_limited = metrics.counter('netsentinel_packets_limited_total',
+                                  'Packets over their source rate limit, by what was done with them', ['policy'])
+
+class _Counter:
+    __slots__ = ('key', 'count', 'error', 'bytes', 'bucket')
+
+    def __init__(self, key):
+        self.key = key
+        self.count = 0
+        self.error = 0
+        self.bytes = 0
+        self.bucket = None
+
+class _Bucket:
+    """Counters sharing one count, in a list linked in ascending count order"""
+    __slots__ = ('count', 'counters', 'prev', 'next')
+
+    def __init__(self, count, prev, next):
+        self.count = count
+        self.counters = {}
+        self.prev = prev
+        self.next = next
+
+class SpaceSaving:
+    """Most frequent keys of a stream in at most `capacity` counters (Space-Saving)
+
+    Counters are grouped in buckets of equal count, linked in ascending order
+    (the stream-summary structure), so add() is O(1): a monitored key moves to
+    the next bucket, and a new key takes over a counter from the minimum
+    bucket, inheriting its count as the error bound. Every key seen more than
+    total / capacity times is monitored, and a count overestimates the true
+    one by at most its error. `bytes` only covers the time a key was monitored.
+    """
+
+    def __init__(self, capacity=HEAVY_HITTER_CAPACITY):
+        self.capacity = capacity
+        self.counters = {}
+        self.head = None  # Bucket with the smallest count
+        self.total = 0
+
+    def add(self, key, size=0):
+        """Count one occurrence of `key` carrying `size` bytes; returns its estimated count"""
+        self.total += 1
+        counter = self.counters.get(key)
+        if counter is not None:
+            previous = counter.bucket
+            del previous.counters[key]
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[key] = _Counter(key)
+            previous = None
+        else:
+            # Evict a key with the minimum count; the newcomer may have been seen that often
+            previous = self.head
+            _, counter = previous.counters.popitem()
+            del self.counters[counter.key]
+            counter.key = key
+            counter.error = counter.count
+            counter.bytes = 0
+            self.counters[key] = counter
+
+        counter.count += 1
+        counter.bytes += size
+        self._place(counter, previous)
+        return counter.count
+
+    def _place(self, counter, previous):
+        """Put a counter in the bucket after `previous` (its old bucket, or None for the front)"""
+        following = previous.next if previous is not None else self.head
+        if following is None or following.count != counter.count:
+            following = _Bucket(counter.count, previous, following)
+            if following.next is not None:
+                following.next.prev = following
+            if previous is not None:
+                previous.next = following
+            else:
+                self.head = following
+        following.counters[counter.key] = counter
+        counter.bucket = following
+
+        if previous is not None and not previous.counters:
+            if previous.prev is not None:
+                previous.prev.next = following
+            else:
+                self.head = following
+            following.prev = previous.prev
+
+class TokenBuckets:
+    """Per-key token buckets, kept in an LRU capped at `max_keys` entries
+
+    A bucket holds up to `burst` tokens and refills at its key's rate; each
+    packet takes one. Keys unseen for longest are forgotten first, and a key
+    that returns starts with a full bucket, as it would have after idling.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_PER_SOURCE, burst=RATE_LIMIT_BURST, overrides=RATE_LIMIT_OVERRIDES,
+                 max_keys=RATE_LIMIT_MAX_SOURCES):
+        self.rate = rate
+        self.burst = burst
+        self.overrides = overrides
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> [tokens, refilled_at]
+
+    def allow(self, key, now):
+        """Take a token for `key` at time `now`; False if its bucket is empty"""
+        rate = self.overrides[key] if key in self.overrides else self.rate
+        if rate is None:
+            return True
+        state = self.buckets.get(key)
+        if state is None:
+            state = self.buckets[key] = [self.burst, now]
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            state[0] = min(self.burst, state[0] + max(now - state[1], 0.0) * rate)
+            state[1] = now
+        if state[0] >= 1:
+            state[0] -= 1
+            return True
+        return False
+
+def merged_top(summaries, size):
+    """Top `size` (key, [count, error, bytes]) over several summaries, counts added up"""
+    totals = {}
+    for summary in summaries:
+        for key, counter in summary.counters.items():
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [counter.count, counter.error, counter.bytes]
+            else:
+                entry[0] += counter.count
+                entry[1] += counter.error
+                entry[2] += counter.bytes
+    return heapq.nlargest(size, totals.items(), key=lambda item: item[1][0])
+
+class TrafficMonitor:
+    """Heavy-hitter tracking and per-source rate limiting for the ingest path
+
+    Sources and (source, destination) pairs are counted in Space-Saving
+    summaries over rotating windows. As with the HyperLogLog in
+    ml/features.py, snapshots cover the current and previous window, so
+    between one and two windows of traffic. Every packet is counted,
+    including ones its source's token bucket then rejects. Rejected packets
+    are dropped, or with the 'summarize' policy folded into per-source totals
+    that the server stores periodically.
+    """
+
+    def __init__(self, capacity=HEAVY_HITTER_CAPACITY, window=HEAVY_HITTER_WINDOW, limiter=None,
+                 policy=RATE_LIMIT_POLICY):
+        self.capacity = capacity
+        self.window = window
+        self.sources = SpaceSaving(capacity)
+        self.pairs = SpaceSaving(capacity)
+        self.previous = None  # (sources, pairs, started) of the last complete window
+        self.started = time.time()
+        if limiter is None and (RATE_LIMIT_PER_SOURCE is not None or RATE_LIMIT_OVERRIDES):
+            limiter = TokenBuckets()
+        self.limiter = limiter
+        self.policy = policy
+        self.limited = {}  # source_ip -> [packets, bytes] rejected since the last take_limited()
+        self.limited_total = 0
+        self.lock = threading.Lock()
+        self.limited_counter = packets_limited.labels(policy)
+
+    def rotate(self, now):
+        self.previous = (self.sources, self.pairs, self.started)
+        self.sources = SpaceSaving(self.capacity)
+        self.pairs = SpaceSaving(self.capacity)
+        self.started = now
+
+    def admit(self, rows):
+        """Count (source_ip, dest_ip, packet_size, protocol) rows; returns those within their source's limit"""
+        now = time.time()
+        with self.lock:
+            if now - self.started >= self.window:
+                self.rotate(now)
+            add_source, add_pair = self.sources.add, self.pairs.add
+            limiter = self.limiter
+            if limiter is None:
+                for source_ip, dest_ip, packet_size, _ in rows:
+                    add_source(source_ip, packet_size)
+                    add_pair((source_ip, dest_ip), packet_size)
+                return rows
+
+            admitted = []
+            for row in rows:
+                source_ip, dest_ip, packet_size, _ = row
+                add_source(source_ip, packet_size)
+                add_pair((source_ip, dest_ip), packet_size)
+                if limiter.allow(source_ip, now):
+                    admitted.append(row)
+                elif self.policy == 'summarize':
+                    entry = self.limited.get(source_ip)
+                    if entry is None:
+                        self.limited[source_ip] = [1, packet_size]
+                    else:
+                        entry[0] += 1
+                        entry[1] += packet_size
+            rejected = len(rows) - len(admitted)
+            self.limited_total += rejected
+        if rejected:
+            self.limited_counter.inc(rejected)
+        return admitted
+
+    def take_limited(self):
+        """{source_ip: [packets, bytes]} summarized since the last call"""
+        with self.lock:
+            limited, self.limited = self.limited, {}
+        return limited
+
+    def snapshot(self, size=TOP_PUBLISH_SIZE):
+        """Top sources and pairs with packet counts, bytes and rates over the tracked window"""
+        now = time.time()
+        with self.lock:
+            if now - self.started >= self.window:
+                self.rotate(now)
+            sources, pairs = [self.sources], [self.pairs]
+            since = self.started
+            if self.previous is not None:
+                sources.append(self.previous[0])
+                pairs.append(self.previous[1])
+                since = self.previous[2]
+            top_sources = merged_top(sources, size)
+            top_pairs = merged_top(pairs, size)
+            total = sum(summary.total for summary in sources)
+            limited_total = self.limited_total
+
+        seconds = max(now - since, 1e-3)
+        return {
+            'updated_at': now,
+            'window_seconds': round(seconds, 3),
+            'total': total,
+            'limited': limited_total,
+            'sources': [
+                {'source_ip': key, 'packets': count, 'bytes': size_sum, 'error': error,
+                 'rate': round(count / seconds, 2)}
+                for key, (count, error, size_sum) in top_sources
+            ],
+            'pairs': [
+                {'source_ip': key[0], 'dest_ip': key[1], 'packets': count, 'bytes': size_sum, 'error': error,
+                 'rate': round(count / seconds, 2)}
+                for key, (count, error, size_sum) in top_pairs
+            ]
+        }
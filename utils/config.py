@@ -1,10 +1,28 @@
 # utils/config.py
 # Configuration file for NetSentinel
+import os
+
+# Repository root; file locations below resolve against it, not the working directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Server Configuration
 SERVER_HOST = 'localhost'
 SERVER_PORT = 9999
 MAX_CONNECTIONS = 5
+SERVER_MODE = 'threaded'  # 'threaded' (one thread per client) or 'asyncio' (single event loop)
+USE_UVLOOP = False  # Use uvloop for the asyncio server when installed
+LISTEN_BACKLOG = 1024  # Accept backlog for the asyncio server
+EXECUTOR_WORKERS = 8  # Threads that run scoring and DB writes for the asyncio server
+WORKER_PROCESSES = 4  # Processes started by server/launcher.py, each binding SERVER_PORT with SO_REUSEPORT
+WORKER_RESTART_DELAY = 1.0  # Seconds before the supervisor restarts a crashed worker
+WORKER_STATS_INTERVAL = 10  # Seconds between aggregated throughput reports
+
+# Wire Protocol Configuration
+PROTOCOL_MODE = 'framed'  # 'framed' (length-prefixed JSON, batched acks), 'binary' (13-byte records, batched acks) or 'legacy' (one JSON per recv)
+ACK_EVERY = 64  # Server sends at least one ack every N frames
+SEND_WINDOW = 1024  # Max unacknowledged frames a client keeps in flight
+MAX_FRAME_SIZE = 65536  # Largest accepted frame payload in bytes
+RECV_BUFFER_SIZE = 65536
 
 # Database Configuration
 DB_CONFIG = {
@@ -14,15 +32,88 @@ DB_CONFIG = {
     'password': 'my_password',
     'port': 5432
 }
+DB_POOL_SIZE = None  # Max connections per process (None = sized to the process: persist workers, API threads, ...)
+DB_POOL_TIMEOUT = 10  # Seconds a checkout waits for a free connection before failing
+DB_POOL_CHECK_AFTER = 30  # Connections idle longer than this are pinged before being handed out
+STATS_TOTAL_SHARDS = 16  # Rows per protocol in packet_stats_total; each connection adds to one, so writers rarely wait on each other
+EXPORT_CHUNK_SIZE = 100000  # Rows per fetch when exporting packets, and per Parquet row group / Arrow batch
+WRITE_BEHIND = True  # Ingestion server buffers inserts and flushes them in bulk (inline mode; the pipeline has its own persist stage)
+WRITE_BUFFER_MAX_ROWS = 100000  # Writers block once this many rows are waiting
+WRITE_BUFFER_FLUSH_ROWS = 5000  # Flush as soon as this many rows are buffered
+WRITE_BUFFER_FLUSH_MS = 200  # ...or this long after the first buffered row
+WRITE_BUFFER_PUT_TIMEOUT = None  # Seconds to block on a full buffer before dropping (None = wait)
+PARTITION_INTERVAL = 'day'  # Range partition size for the packets table: 'day' or 'hour'
+PARTITION_PREMAKE = 3  # Partitions created ahead of the current one
+RETENTION_DAYS = 30  # Partitions older than this are dropped (None = keep forever)
+PARTITION_MAINTENANCE_INTERVAL = 3600  # Seconds between partition maintenance runs in the ingestion server
+PARTITION_LOCK_TIMEOUT_MS = 2000  # Longest wait for the packets table lock to detach a partition; retried next run
+LIVE_FEED = True  # Ingestion publishes new packets and stats deltas with NOTIFY for the dashboard stream
+LIVE_FEED_CHANNEL = 'packets_live'
+LIVE_FEED_MAX_PACKETS = 20  # Newest packets included per notification (NOTIFY payloads are capped at 8000 bytes)
 
 # ML Model Configuration
-MODEL_PATH = 'ml/anomaly_detector.pkl'
+MODEL_PATH = os.path.join(BASE_DIR, 'ml', 'anomaly_detector.pkl')  # Legacy single-file model, imported into an empty registry
+MODEL_DIR = os.path.join(BASE_DIR, 'ml', 'models')  # Versioned model registry (model-vNNNNNN.pkl + CURRENT pointer)
+MODEL_KEEP_VERSIONS = 10  # Older versions are pruned after each publish
+MODEL_WATCH_INTERVAL = 5  # Seconds between checks for a new CURRENT model in running processes
+INFERENCE_BACKEND = 'compiled'  # 'compiled' (NumPy scorer from model-vNNNNNN.npz) or 'sklearn' (unpickled model)
 CONTAMINATION = 0.1  # Expected proportion of anomalies
+TRAIN_SAMPLE_SIZE = 100000  # Reservoir size for retraining; bounds memory regardless of table size
+TRAIN_WINDOW_HOURS = 168  # Retrain on the most recent N hours of traffic (None = whole table)
+TRAIN_CHUNK_SIZE = 50000  # Rows fetched per round-trip while streaming training data
+RESCORE_AFTER_RETRAIN = True  # Rescore stored packets with each model a retraining job publishes or a rollback restores
+RESCORE_CHUNK_SIZE = 50000  # Rows read and scored per chunk by the rescoring job (ml/rescore.py)
+RESCORE_UPDATE_BATCH = 5000  # Rows written per UPDATE transaction; bounds how long row locks are held
+RESCORE_ROWS_PER_SECOND = 50000  # Rescoring throttle so ingestion keeps priority (None or 0 = unthrottled)
+FLOW_FEATURES = True  # Feed per-source / per-(source, destination) windowed aggregates to the model
+FLOW_WINDOW_SECONDS = 10  # Time constant of the flow rate windows
+FLOW_MAX_SOURCES = 100000  # Max source IPs tracked at once (least recently seen are evicted)
+FLOW_MAX_PAIRS = 200000  # Max (source, destination) pairs tracked at once
+FLOW_TTL_SECONDS = 300  # Flows idle for longer than this are evicted
+FLOW_HLL_PRECISION = 6  # HyperLogLog registers per source = 2^precision (~10% error at 6)
+BATCH_SCORING = True  # Staged ingestion pipeline with micro-batched scoring (False = parse, score and store inline per packet)
+BATCH_MAX_SIZE = 256  # Max packets per scoring batch
+BATCH_MAX_WAIT_MS = 5  # Max time a packet waits for its batch to fill
+PIPELINE_POLICY = 'block'  # When stage queues fill: 'block' (TCP backpressure), 'drop' (shed new packets) or 'skip_persist' (score everything, skip storing)
+DECODE_WORKERS = 2  # Threads turning received buffers into packet rows
+SCORE_WORKERS = 1  # Threads scoring micro-batches (1 keeps arrival order)
+PERSIST_WORKERS = 2  # Threads writing scored rows to the database
+DECODE_QUEUE_SIZE = 256  # Received buffers waiting to be decoded (each up to ACK_EVERY frames)
+SCORE_QUEUE_SIZE = 20000  # Packets waiting to be scored
+PERSIST_QUEUE_SIZE = 100000  # Scored packets waiting to be stored
+PERSIST_BATCH_SIZE = 5000  # Max rows per database write
+PERSIST_MAX_WAIT_MS = 200  # Max time a scored row waits for its write batch to fill
+HEAVY_HITTERS = True  # Track top sources and (source, destination) pairs at ingestion, for /api/top and rate limits
+HEAVY_HITTER_CAPACITY = 1000  # Counters per Space-Saving summary; any key above 1/capacity of the traffic is tracked
+HEAVY_HITTER_WINDOW = 60  # Seconds per tracking window; top talkers cover the last one to two windows
+TOP_PUBLISH_INTERVAL = 2  # Seconds between top-talker snapshots sent to the API (NOTIFY on LIVE_FEED_CHANNEL)
+TOP_PUBLISH_SIZE = 20  # Sources and pairs per snapshot (NOTIFY payloads are capped at 8000 bytes)
+RATE_LIMIT_PER_SOURCE = None  # Packets/s each source may send before the excess is shed (None = no limit)
+RATE_LIMIT_BURST = 2000  # Packets a source may send at once on top of its rate
+RATE_LIMIT_OVERRIDES = {}  # Per-source rates that replace RATE_LIMIT_PER_SOURCE, e.g. {'10.0.0.5': 50000, '10.0.0.9': None}
+RATE_LIMIT_MAX_SOURCES = 100000  # Token buckets kept at once (least recently seen sources are forgotten)
+RATE_LIMIT_POLICY = 'summarize'  # Excess packets: 'drop', or 'summarize' into per-source, per-minute counts (rate_limited table)
+
+# Observability
+METRICS_PORT = 9100  # Ingestion server serves /metrics here (launcher workers use METRICS_PORT + 1 + index; None = off)
+LOG_PACKETS = False  # Structured per-packet log lines (JSON); off by default, they cost throughput
+LOG_PACKET_SAMPLE = 0.01  # Fraction of normal packets logged when LOG_PACKETS is on (anomalies are always candidates)
+LOG_PACKET_RATE_LIMIT = 20  # Max packet log lines per second; the excess is counted, not printed
 
 # Flask Configuration
 FLASK_HOST = '0.0.0.0'
 FLASK_PORT = 5000
 FLASK_DEBUG = True
+MAX_PAGE_SIZE = 1000  # Upper bound for the `limit` parameter of packet listing endpoints
+MAX_TIMESERIES_MINUTES = 1440  # Longest window served by /api/stats/timeseries
+LIVE_SUBSCRIBER_QUEUE = 100  # Messages buffered per stream viewer before updates are dropped for it
+LIVE_HEARTBEAT = 15  # Seconds between keepalive comments on idle streams
+API_CACHE_TTL = 2  # Seconds a serialized /api/packets, /api/filter or /api/stats response is reused (0 = off)
+API_CACHE_MAX_ENTRIES = 1024  # Distinct cached responses kept per process (least recently used go first)
+WEB_WORKERS = 4  # gunicorn worker processes for the API (web/gunicorn.conf.py); each has its own DB pool
+WEB_THREADS = 16  # Request threads per worker; each worker's connection pool has this many connections
+LIVE_MAX_SUBSCRIBERS = WEB_THREADS // 2  # Open /api/stream viewers per worker (each holds a thread); more get 503
+WEB_TIMEOUT = 60  # Seconds a worker may stay unresponsive before gunicorn restarts it
 
 # Protocol Types
 PROTOCOLS = ['TCP', 'UDP', 'ICMP', 'HTTP', 'HTTPS']
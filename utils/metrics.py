@@ -0,0 +1,282 @@
+# utils/metrics.py
+# Process-local counters, gauges and histograms rendered in the Prometheus text
+# exposition format, plus a tiny HTTP endpoint for processes without Flask.
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Default latency buckets in seconds: 50us .. 10s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for metrics with an optional fixed set of label names"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        if not self.labelnames:
+            # Unlabelled metrics are exported as 0 before their first update
+            self.labels()
+
+    def labels(self, *values, **kwargs):
+        """Child metric for one combination of label values"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def _unlabelled(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            children = sorted(self.children.items())
+        for key, child in children:
+            lines.extend(child.samples(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Compute the value at scrape time (e.g. a queue's current size)"""
+        self.function = function
+
+    def samples(self, name, labelnames, key):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return []
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1):
+        self._unlabelled().dec(amount)
+
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the elapsed seconds of its block"""
+        return _Timer(self)
+
+    def samples(self, name, labelnames, key):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, key)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Named collection of metrics; get-or-create so modules can share metrics"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames=labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames=labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames=labelnames, buckets=buckets)
+
+    def render(self):
+        """Every metric in the text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Default registry shared by every module in a process
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='0.0.0.0', registry=REGISTRY):
+    """Serve GET /metrics from a background thread; returns the HTTP server"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -0,0 +1,60 @@
+# utils/packet_log.py
+# Per-packet logging that cannot become the bottleneck: off by default, sampled,
+# rate-limited, one JSON object per line.
+import json
+import random
+import threading
+import time
+import sys
+sys.path.append('..')
+from utils.config import LOG_PACKETS, LOG_PACKET_SAMPLE, LOG_PACKET_RATE_LIMIT
+from utils import metrics
+
+suppressed_lines = metrics.counter(
+    'netsentinel_packet_log_suppressed_total', 'Packet log lines dropped by the rate limit'
+)
+
+class PacketLog:
+    """Sampled, token-bucket rate-limited JSON lines for processed packets
+
+    Anomalies are always candidates; normal packets are logged with
+    probability `sample`. At most `rate_limit` lines per second are printed.
+    """
+
+    def __init__(self, enabled=LOG_PACKETS, sample=LOG_PACKET_SAMPLE, rate_limit=LOG_PACKET_RATE_LIMIT):
+        self.enabled = enabled
+        self.sample = sample
+        self.rate_limit = rate_limit
+        self.tokens = float(rate_limit)
+        self.refilled = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Take a token from the bucket if one is available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.refilled) * self.rate_limit)
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+        suppressed_lines.inc()
+        return False
+
+    def log(self, source_ip, dest_ip, packet_size, protocol, is_anomaly):
+        """Maybe print one line for a processed packet"""
+        if not self.enabled:
+            return
+        if not is_anomaly and random.random() >= self.sample:
+            return
+        if not self.allow():
+            return
+        print(json.dumps({
+            'event': 'packet',
+            'time': round(time.time(), 3),
+            'source_ip': source_ip,
+            'dest_ip': dest_ip,
+            'packet_size': packet_size,
+            'protocol': protocol,
+            'anomaly': bool(is_anomaly)
+        }))
@@ -0,0 +1,151 @@
+# utils/protocol.py
+# Wire protocol shared by the NetSentinel server and traffic clients
+#
+# Framed mode: the client opens the connection with a hello (MAGIC + encoding
+# byte), then sends length-prefixed frames (4-byte big-endian length followed
+# by the payload). The server acknowledges in batches with a sequence-number
+# watermark: {"status": "received", "seq": <frames received so far>}.
+#
+# Binary mode: a hello with ENCODING_BINARY, then a plain stream of fixed-size
+# 13-byte records (see RECORD). Acks are the same JSON watermark frames, counting
+# records. The packet id is not transmitted.
+#
+# Legacy mode: no hello, one JSON document per send and one ack per packet.
+import json
+import socket
+import struct
+from functools import lru_cache
+import numpy as np
+import sys
+sys.path.append('..')
+from utils.config import MAX_FRAME_SIZE, PROTOCOLS
+
+MAGIC = b'NSF1'
+ENCODING_JSON = 0
+ENCODING_BINARY = 1
+HELLO_SIZE = len(MAGIC) + 1
+
+_LENGTH = struct.Struct('!I')
+
+# source IPv4, dest IPv4, packet size, protocol code (index into PROTOCOLS)
+RECORD = struct.Struct('!IIIB')
+RECORD_DTYPE = np.dtype([('source_ip', '>u4'), ('dest_ip', '>u4'), ('packet_size', '>u4'), ('protocol', 'u1')])
+UNKNOWN_PROTOCOL = 255
+MAX_PACKET_SIZE = 2 ** 31 - 1  # the u32 field holds sizes the INTEGER column does not
+_PROTOCOL_CODES = {name: code for code, name in enumerate(PROTOCOLS)}
+_PROTOCOL_NAMES = list(PROTOCOLS)
+
+
+class FrameError(Exception):
+    """Raised when the peer sends a malformed or oversized frame"""
+
+
+def encode_hello(encoding=ENCODING_JSON):
+    """Build the connection preamble for framed or binary mode"""
+    return MAGIC + bytes([encoding])
+
+
+def encode_frame(payload):
+    """Prefix a payload with its length"""
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def encode_json_frame(obj):
+    """Serialize an object as a JSON frame"""
+    return encode_frame(json.dumps(obj).encode('utf-8'))
+
+
+def encode_record(packet):
+    """Pack a packet dict into one binary record"""
+    return RECORD.pack(
+        int.from_bytes(socket.inet_aton(packet['source_ip']), 'big'),
+        int.from_bytes(socket.inet_aton(packet['dest_ip']), 'big'),
+        packet['packet_size'],
+        _PROTOCOL_CODES.get(packet['protocol'], UNKNOWN_PROTOCOL)
+    )
+
+
+@lru_cache(maxsize=65536)
+def ip_to_str(address):
+    """Dotted quad of an IPv4 address given as an integer (cached: addresses repeat)"""
+    return socket.inet_ntoa(address.to_bytes(4, 'big'))
+
+
+def records_to_rows(records):
+    """Convert decoded records into (source_ip, dest_ip, packet_size, protocol) rows
+
+    Records with an oversized packet or a protocol code outside PROTOCOLS are
+    dropped here, so one of them cannot fail a whole batch's insert.
+    """
+    valid = (records['packet_size'] <= MAX_PACKET_SIZE) & (records['protocol'] < len(_PROTOCOL_NAMES))
+    if not valid.all():
+        records = records[valid]
+    names = _PROTOCOL_NAMES
+    return [
+        (ip_to_str(source), ip_to_str(dest), size, names[protocol])
+        for source, dest, size, protocol in zip(
+            records['source_ip'].tolist(), records['dest_ip'].tolist(),
+            records['packet_size'].tolist(), records['protocol'].tolist()
+        )
+    ]
+
+
+def encode_ack(seq):
+    """Build a batched acknowledgment up to sequence number `seq`"""
+    return encode_json_frame({'status': 'received', 'seq': seq})
+
+
+class FrameDecoder:
+    """Incrementally split a byte stream into length-prefixed frames"""
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes and return every complete frame payload"""
+        self.buffer += data
+        frames = []
+        offset = 0
+        end = len(self.buffer)
+
+        while end - offset >= _LENGTH.size:
+            (length,) = _LENGTH.unpack_from(self.buffer, offset)
+            if length > self.max_frame_size:
+                raise FrameError(f"Frame of {length} bytes exceeds limit of {self.max_frame_size}")
+            if end - offset - _LENGTH.size < length:
+                break
+            start = offset + _LENGTH.size
+            frames.append(bytes(self.buffer[start:start + length]))
+            offset = start + length
+
+        if offset:
+            del self.buffer[:offset]
+        return frames
+
+    @property
+    def pending(self):
+        """Number of buffered bytes belonging to an incomplete frame"""
+        return len(self.buffer)
+
+
+class RecordDecoder:
+    """Split a byte stream into binary records, a whole receive buffer at a time"""
+
+    def __init__(self):
+        self.remainder = b''
+
+    def feed(self, data):
+        """Add received bytes and return every complete record as a structured array"""
+        if self.remainder:
+            data = self.remainder + data
+        count = len(data) // RECORD.size
+        # frombuffer views the received bytes in place; no per-field parsing
+        records = np.frombuffer(data, dtype=RECORD_DTYPE, count=count)
+        self.remainder = bytes(data[count * RECORD.size:])
+        return records
+
+    @property
+    def pending(self):
+        """Number of buffered bytes belonging to an incomplete record"""
+        return len(self.remainder)
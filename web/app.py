@@ -1,45 +1,152 @@
 # web/app.py
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import json
+import multiprocessing
+import queue
+import threading
+import time
 import sys
 import os
 sys.path.append('..')
-from database.db import Database
-from ml.anomaly_model import AnomalyDetector
-from utils.config import FLASK_HOST, FLASK_PORT, FLASK_DEBUG
+from ml.model_registry import ModelRegistry
+from utils import metrics
+from utils.config import (FLASK_HOST, FLASK_PORT, FLASK_DEBUG, MAX_PAGE_SIZE, MAX_TIMESERIES_MINUTES, LIVE_HEARTBEAT,
+                          WEB_THREADS, TOP_PUBLISH_SIZE, RESCORE_AFTER_RETRAIN)
+from live import LiveFeed
+from cache import ResponseCache
+
+class PerProcess:
+    """Build an object on first use in each process and delegate attribute access to it
+
+    Under a pre-forking server the module is imported once and then forked, so
+    anything holding connections or threads has to be created in the worker.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.instance = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.instance = self.factory()
+                    self.pid = os.getpid()
+        return self.instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
 
 app = Flask(__name__, static_folder='frontend', static_url_path='')
 CORS(app)
 
-db = Database()
-ml_model = AnomalyDetector()
+def open_database():
+    """The worker's Database; psycopg2 is imported here rather than at startup"""
+    from database.db import Database
+    return Database(pool_size=WEB_THREADS)
+
+# Each worker gets its own connection pool, one connection per request thread, on its first request
+db = PerProcess(open_database)
+model_registry = ModelRegistry()
+
+# Retraining and rescoring run in separate processes so they never block request threads,
+# each with its own so an hours-long rescore never holds up the next retrain
+retrain_executor = PerProcess(
+    lambda: ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+)
+rescore_executor = PerProcess(
+    lambda: ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+)
+live_feed = PerProcess(lambda: LiveFeed(db))
+response_cache = ResponseCache()
+
+http_requests = metrics.counter('netsentinel_http_requests_total', 'API requests served', ['endpoint', 'status'])
+http_seconds = metrics.histogram('netsentinel_http_request_seconds', 'API request handling time', ['endpoint'])
+metrics.gauge('netsentinel_live_subscribers', 'Open dashboard event streams').set_function(
+    lambda: len(live_feed.subscribers)
+)
+
+@app.before_request
+def start_timer():
+    request.started_at = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Count and time every request by route (not raw path, to keep label cardinality bounded)"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_requests.labels(endpoint, response.status_code).inc()
+    if hasattr(request, 'started_at'):
+        http_seconds.labels(endpoint).observe(time.perf_counter() - request.started_at)
+    return response
 
 @app.route('/')
 def index():
     """Serve the frontend"""
     return send_from_directory('frontend', 'index.html')
 
+PACKET_FIELDS = ('id', 'source_ip', 'dest_ip', 'packet_size', 'protocol', 'timestamp', 'anomaly_flag', 'model_version')
+
+def json_default(value):
+    """Serialize the non-JSON types found in query results"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def to_json(payload):
+    """Compact JSON body as bytes"""
+    return json.dumps(payload, default=json_default, separators=(',', ':')).encode('utf-8')
+
+def packet_to_dict(p):
+    """Convert a packets row to its JSON form (timestamps are serialized by to_json)"""
+    return dict(zip(PACKET_FIELDS, p))
+
+def cached_response(key, compute):
+    """Serve compute()'s JSON body from the response cache, answering If-None-Match with 304
+
+    `key` is the endpoint's parsed parameters, so equivalent query strings share an entry.
+    """
+    body, etag = response_cache.get(request.url_rule.rule, key, compute)
+    response = Response(body, content_type='application/json')
+    response.set_etag(etag)
+    # Clients revalidate every time; the server-side TTL decides freshness
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def encode_cursor(p):
+    """Opaque pagination cursor for the row after which the next page starts"""
+    return f"{p[5].isoformat()},{p[0]}"
+
+def decode_cursor(cursor):
+    """Parse a cursor produced by encode_cursor into (timestamp, id)"""
+    timestamp, packet_id = cursor.rsplit(',', 1)
+    return datetime.fromisoformat(timestamp), int(packet_id)
+
+def page_body(packets, limit):
+    """JSON body for one page of packets, with the cursor for the next page"""
+    next_cursor = encode_cursor(packets[-1]) if packets and len(packets) == limit and packets[-1][5] else None
+    return to_json({
+        'success': True,
+        'packets': [packet_to_dict(p) for p in packets],
+        'next_cursor': next_cursor
+    })
+
 @app.route('/api/packets', methods=['GET'])
 def get_packets():
-    """Get all packets"""
+    """Get the most recent packets, one page at a time"""
+    try:
+        limit = max(1, min(request.args.get('limit', 100, type=int), MAX_PAGE_SIZE))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid parameter: {e}'}), 400
+
     try:
-        limit = request.args.get('limit', 100, type=int)
-        packets = db.get_all_packets(limit)
-        
-        # Convert to JSON format
-        packet_list = []
-        for p in packets:
-            packet_list.append({
-                'id': p[0],
-                'source_ip': p[1],
-                'dest_ip': p[2],
-                'packet_size': p[3],
-                'protocol': p[4],
-                'timestamp': p[5].isoformat() if p[5] else None,
-                'anomaly_flag': p[6]
-            })
-        
-        return jsonify({'success': True, 'packets': packet_list})
+        return cached_response((after, limit), lambda: page_body(db.query_packets(after=after, limit=limit), limit))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -47,64 +154,205 @@ def get_packets():
 def get_stats():
     """Get packet statistics"""
     try:
-        stats = db.get_stats()
-        return jsonify({'success': True, 'stats': stats})
+        return cached_response((), lambda: to_json({'success': True, 'stats': db.get_stats()}))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/stats/timeseries', methods=['GET'])
+def get_timeseries():
+    """Per-minute traffic and anomaly rate over a recent window"""
+    try:
+        minutes = max(1, min(request.args.get('minutes', 60, type=int), MAX_TIMESERIES_MINUTES))
+        protocol = request.args.get('protocol') or None
+        return cached_response((minutes, protocol), lambda: timeseries_body(minutes, protocol))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def timeseries_body(minutes, protocol):
+    """JSON body for /api/stats/timeseries"""
+    rows = db.get_timeseries(minutes, protocol)
+
+    series = [{
+        'bucket': bucket,
+        'packets': packets,
+        'anomalies': anomalies,
+        'bytes': size,
+        'anomaly_rate': anomalies / packets if packets else 0
+    } for bucket, packets, anomalies, size in rows]
+
+    total = sum(point['packets'] for point in series)
+    anomalies = sum(point['anomalies'] for point in series)
+    return to_json({
+        'success': True,
+        'minutes': minutes,
+        'total': total,
+        'anomalies': anomalies,
+        'anomaly_rate': anomalies / total if total else 0,
+        'series': series
+    })
+
 @app.route('/api/retrain', methods=['POST'])
 def retrain_model():
-    """Retrain the ML model"""
+    """Start a background retraining job"""
+    # Imported here so the read endpoints never pay for loading scikit-learn
+    from ml.anomaly_model import retrain_job, new_job_id
     try:
-        success = ml_model.train_from_database(db)
-        if success:
-            return jsonify({'success': True, 'message': 'Model retrained successfully'})
-        else:
-            return jsonify({'success': False, 'error': 'Not enough data to retrain'}), 400
+        # The claim lives in the registry, so it holds across every worker process
+        job_id = new_job_id()
+        running = model_registry.claim('retrain', job_id)
+        if running is not None:
+            return jsonify({'success': False, 'error': 'A retraining job is already running', 'job': running}), 409
+
+        try:
+            job = model_registry.write_job(job_id, status='queued', queued_at=datetime.now().isoformat())
+            future = retrain_executor.submit(retrain_job, job_id)
+        except Exception:
+            model_registry.release('retrain', job_id)
+            raise
+        if RESCORE_AFTER_RETRAIN:
+            future.add_done_callback(lambda future: rescore_after_retrain(job_id, future))
+        return jsonify({'success': True, 'job': job}), 202
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def start_rescore(version, restart=False):
+    """Queue a job applying `version` to the stored packets; returns its job record"""
+    from ml.anomaly_model import rescore_job, new_job_id
+    job_id = new_job_id()
+    job = model_registry.write_job(job_id, kind='rescore', status='queued', version=version,
+                                   queued_at=datetime.now().isoformat())
+    rescore_executor.submit(rescore_job, job_id, version, restart)
+    return job
+
+def rescore_after_retrain(job_id, future):
+    """Done-callback of a retraining job: rescore history with the model it published"""
+    try:
+        job = future.result()
+        if job and job.get('status') == 'succeeded':
+            rescore = start_rescore(job['version'])
+            model_registry.write_job(job_id, rescore_job=rescore['job_id'])
+    except Exception as e:
+        print(f"⚠️ Could not start rescoring after retrain job {job_id}: {e}")
+
+@app.route('/api/retrain/<job_id>', methods=['GET'])
+def retrain_status(job_id):
+    """Status of a retraining or rescoring job"""
+    job = model_registry.read_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/model', methods=['GET'])
+def model_info():
+    """Current and available model versions"""
+    return jsonify({
+        'success': True,
+        'current_version': model_registry.current_version(),
+        'versions': model_registry.versions()
+    })
+
+@app.route('/api/model/rollback', methods=['POST'])
+def rollback_model():
+    """Point every process back at the previous model version"""
+    try:
+        version = model_registry.rollback()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    rescore = None
+    if RESCORE_AFTER_RETRAIN:
+        try:
+            # Saved progress for this version predates the rows the newer model flagged since
+            rescore = start_rescore(version, restart=True)
+        except Exception as e:
+            print(f"⚠️ Could not start rescoring after rollback to v{version}: {e}")
+    return jsonify({'success': True, 'current_version': version, 'rescore_job': rescore})
+
 @app.route('/api/filter', methods=['GET'])
 def filter_packets():
-    """Filter packets by protocol"""
+    """Filter packets by protocol, anomaly flag, IPs, size range and time window"""
+    try:
+        args = request.args
+        anomaly = args.get('anomaly')
+        if anomaly is not None:
+            anomaly = anomaly.lower() == 'true'
+        elif args.get('anomaly_only', 'false').lower() == 'true':
+            anomaly = True
+
+        since = args.get('since')
+        until = args.get('until')
+        cursor = args.get('cursor')
+        limit = max(1, min(args.get('limit', 100, type=int), MAX_PAGE_SIZE))
+
+        filters = {
+            'protocol': args.get('protocol') or None,
+            'anomaly': anomaly,
+            'source_ip': args.get('source_ip') or None,
+            'dest_ip': args.get('dest_ip') or None,
+            'min_size': int(args['min_size']) if args.get('min_size') else None,
+            'max_size': int(args['max_size']) if args.get('max_size') else None,
+            'since': datetime.fromisoformat(since) if since else None,
+            'until': datetime.fromisoformat(until) if until else None,
+            'after': decode_cursor(cursor) if cursor else None
+        }
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid parameter: {e}'}), 400
+
     try:
-        protocol = request.args.get('protocol', None)
-        anomaly_only = request.args.get('anomaly_only', 'false').lower() == 'true'
-        
-        # This is a simplified version - you can extend the database class
-        # to support more complex queries
-        packets = db.get_all_packets(1000)
-        
-        # Filter in Python (for simplicity)
-        filtered = []
-        for p in packets:
-            packet_dict = {
-                'id': p[0],
-                'source_ip': p[1],
-                'dest_ip': p[2],
-                'packet_size': p[3],
-                'protocol': p[4],
-                'timestamp': p[5].isoformat() if p[5] else None,
-                'anomaly_flag': p[6]
-            }
-            
-            if protocol and p[4] != protocol:
-                continue
-            if anomaly_only and not p[6]:
-                continue
-            
-            filtered.append(packet_dict)
-        
-        return jsonify({'success': True, 'packets': filtered})
+        key = tuple(sorted(filters.items())) + (('limit', limit),)
+        return cached_response(key, lambda: page_body(db.query_packets(limit=limit, **filters), limit))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/top', methods=['GET'])
+def get_top():
+    """Top sources and (source, destination) pairs, from the snapshots ingestion publishes (no database scan)"""
+    try:
+        limit = max(1, min(request.args.get('limit', 10, type=int), TOP_PUBLISH_SIZE))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid parameter: {e}'}), 400
+    # Snapshots arrive on the live feed's LISTEN connection; the first call starts it
+    live_feed.start()
+    return jsonify({'success': True, **live_feed.top_talkers(limit)})
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """Server-sent events with new packets and stats deltas pushed by ingestion"""
+    subscription = live_feed.subscribe()
+    if subscription is None:
+        # Each stream holds a request thread for as long as it is open; the rest stay free for the API
+        return jsonify({'success': False, 'error': 'Too many open streams, try again later'}), 503, {
+            'Retry-After': str(LIVE_HEARTBEAT)
+        }
+
+    def events():
+        try:
+            yield live_feed.snapshot_event()
+            while True:
+                try:
+                    yield subscription.get(timeout=LIVE_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            live_feed.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'service': 'NetSentinel API'})
 
 if __name__ == '__main__':
+    # Development server; for production run `gunicorn -c gunicorn.conf.py app:app` from web/
     print("🌐 Starting Flask API server...")
     print(f"📡 API available at http://{FLASK_HOST}:{FLASK_PORT}")
     print(f"📊 Dashboard at http://{FLASK_HOST}:{FLASK_PORT}/")
@@ -0,0 +1,90 @@
+# web/cache.py
+# Short-lived cache of serialized API responses with request coalescing
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import sys
+sys.path.append('..')
+from utils import metrics
+from utils.config import API_CACHE_TTL, API_CACHE_MAX_ENTRIES
+
+cache_requests = metrics.counter('netsentinel_api_cache_total', 'Cacheable API requests by outcome', ['endpoint', 'result'])
+
+class _Flight:
+    """One in-progress computation that concurrent identical requests wait on"""
+    __slots__ = ('done', 'entry', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+class ResponseCache:
+    """JSON response bodies keyed on (endpoint, normalized parameters)
+
+    Entries hold the serialized body and its ETag, so a hit costs neither a
+    database query nor a re-serialization. While a key is being computed,
+    other requests for it wait for that result instead of querying again.
+    The table is LRU-bounded at `max_entries`; entries expire after `ttl`.
+    """
+
+    def __init__(self, ttl=API_CACHE_TTL, max_entries=API_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (body, etag, expires)
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def get(self, endpoint, key, compute):
+        """(body, etag) for key, calling compute() -> bytes at most once per expiry"""
+        key = (endpoint,) + key
+        if not self.ttl:
+            body = compute()
+            return body, make_etag(body)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] > time.monotonic():
+                self.entries.move_to_end(key)
+                cache_requests.labels(endpoint, 'hit').inc()
+                return entry[0], entry[1]
+
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+
+        if not leader:
+            cache_requests.labels(endpoint, 'coalesced').inc()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry[0], flight.entry[1]
+
+        cache_requests.labels(endpoint, 'miss').inc()
+        try:
+            body = compute()
+            flight.entry = (body, make_etag(body), time.monotonic() + self.ttl)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+                if flight.entry is not None:
+                    self.entries[key] = flight.entry
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            flight.done.set()
+        return flight.entry[0], flight.entry[1]
+
+    def clear(self):
+        """Drop every cached response"""
+        with self.lock:
+            self.entries.clear()
+
+def make_etag(body):
+    """Strong validator derived from the body bytes"""
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
@@ -0,0 +1,24 @@
+# web/gunicorn.conf.py
+# Production serving for the API:
+#
+#   cd web
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Threaded workers: a request blocked on PostgreSQL holds one thread, not a
+# whole process, and the psycopg2 call releases the GIL while it waits. Note
+# that every open /api/stream viewer also holds a thread for its lifetime.
+import sys
+sys.path.append('..')
+from utils.config import FLASK_HOST, FLASK_PORT, WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT
+
+bind = f"{FLASK_HOST}:{FLASK_PORT}"
+workers = WEB_WORKERS
+worker_class = 'gthread'
+threads = WEB_THREADS
+timeout = WEB_TIMEOUT
+keepalive = 5
+
+# Import the app once in the master and fork it; connection pools, the live
+# feed and the retraining executor are created per worker on first use
+preload_app = True
+accesslog = None
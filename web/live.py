@@ -0,0 +1,169 @@
+# web/live.py
+# Fans ingestion notifications out to dashboard streams
+import json
+import queue
+import select
+import threading
+import time
+import sys
+sys.path.append('..')
+from utils.config import LIVE_FEED_CHANNEL, LIVE_SUBSCRIBER_QUEUE, LIVE_MAX_SUBSCRIBERS, TOP_PUBLISH_INTERVAL
+
+RECONNECT_DELAY = 5  # Seconds between LISTEN reconnection attempts
+TOP_STALE_AFTER = 3 * TOP_PUBLISH_INTERVAL  # Snapshots of servers silent for longer are left out of /api/top
+
+class LiveFeed:
+    """Single LISTEN connection per process, shared by every stream viewer
+
+    Each notification is turned into one pre-serialized server-sent event and
+    put on every subscriber queue, so the cost per viewer is one queue put and
+    the database sees one connection no matter how many dashboards are open.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.stats = {'total': 0, 'anomalies': 0, 'bytes': 0, 'protocols': {}}
+        self.top = {}  # Ingest server -> (received_at, latest top-talker snapshot)
+        self.thread = None
+
+    def start(self):
+        """Start the listener thread on first use"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='live-feed', daemon=True)
+                self.thread.start()
+
+    def subscribe(self, max_subscribers=LIVE_MAX_SUBSCRIBERS):
+        """Register a viewer and return its message queue; None if `max_subscribers` are already open"""
+        self.start()
+        subscription = queue.Queue(maxsize=LIVE_SUBSCRIBER_QUEUE)
+        with self.lock:
+            if len(self.subscribers) >= max_subscribers:
+                return None
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Forget a viewer whose stream has closed"""
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def snapshot_event(self):
+        """Current totals as a server-sent event, sent when a viewer connects"""
+        with self.lock:
+            return format_event('stats', {'stats': self.stats})
+
+    def run(self):
+        """Listen for notifications forever, reconnecting on failure"""
+        while True:
+            conn = None
+            try:
+                conn = self.db.listen(LIVE_FEED_CHANNEL)
+                # Totals are read once per connection, after LISTEN, and then kept current from deltas.
+                # Deltas committed between the two are both delivered and counted; the snapshot spots them.
+                stats, snapshot = self.db.get_stats_snapshot()
+                with self.lock:
+                    self.stats = stats
+                self.broadcast(self.snapshot_event())
+                print(f"📡 Live feed listening on '{LIVE_FEED_CHANNEL}'")
+
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        payload = json.loads(conn.notifies.pop(0).payload)
+                        if 'txid' in payload and snapshot_counts(snapshot, payload['txid']):
+                            continue
+                        self.handle(payload)
+            except Exception as e:
+                print(f"⚠️ Live feed error: {e}. Reconnecting in {RECONNECT_DELAY}s...")
+            finally:
+                if conn:
+                    conn.close()
+            time.sleep(RECONNECT_DELAY)
+
+    def handle(self, payload):
+        """Apply a stats delta and broadcast the update to every viewer"""
+        if 'top' in payload:
+            self.handle_top(payload['top'])
+            return
+        delta = payload['delta']
+        with self.lock:
+            stats = self.stats
+            stats['total'] = stats.get('total', 0) + delta['total']
+            stats['anomalies'] = stats.get('anomalies', 0) + delta['anomalies']
+            stats['bytes'] = stats.get('bytes', 0) + delta['bytes']
+            protocols = stats.setdefault('protocols', {})
+            for protocol, counts in delta.get('protocols', {}).items():
+                current = protocols.setdefault(protocol, {'total': 0, 'anomalies': 0, 'bytes': 0})
+                for key, value in counts.items():
+                    current[key] += value
+
+            event = format_event('packets', {
+                'packets': payload['packets'],
+                'delta': delta,
+                'stats': stats
+            })
+        self.broadcast(event)
+
+    def handle_top(self, snapshot):
+        """Keep an ingest server's latest top-talker snapshot and push the merged view to viewers"""
+        with self.lock:
+            self.top[snapshot.get('server')] = (time.monotonic(), snapshot)
+        self.broadcast(format_event('top', self.top_talkers()))
+
+    def top_talkers(self, limit=None):
+        """Top sources and pairs across every ingest server that published recently"""
+        now = time.monotonic()
+        with self.lock:
+            for server in [server for server, (received, _) in self.top.items() if now - received > TOP_STALE_AFTER]:
+                del self.top[server]
+            snapshots = [snapshot for _, snapshot in self.top.values()]
+
+        # A source can reach several servers (one per connection); add its numbers up
+        sources, pairs = {}, {}
+        for snapshot in snapshots:
+            for entry in snapshot['sources']:
+                merge_entry(sources, entry['source_ip'], entry)
+            for entry in snapshot['pairs']:
+                merge_entry(pairs, (entry['source_ip'], entry['dest_ip']), entry)
+        return {
+            'servers': len(snapshots),
+            'updated_at': max((snapshot['updated_at'] for snapshot in snapshots), default=None),
+            'window_seconds': max((snapshot['window_seconds'] for snapshot in snapshots), default=0),
+            'total': sum(snapshot['total'] for snapshot in snapshots),
+            'limited': sum(snapshot['limited'] for snapshot in snapshots),
+            'sources': sorted(sources.values(), key=lambda entry: -entry['packets'])[:limit],
+            'pairs': sorted(pairs.values(), key=lambda entry: -entry['packets'])[:limit]
+        }
+
+    def broadcast(self, event):
+        """Queue an event for every viewer; slow viewers miss updates instead of blocking"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                pass
+
+def merge_entry(merged, key, entry):
+    """Add a top-talker entry's counts into `merged[key]`"""
+    current = merged.get(key)
+    if current is None:
+        merged[key] = dict(entry)
+        return
+    for field in ('packets', 'bytes', 'error', 'rate'):
+        current[field] += entry[field]
+
+def snapshot_counts(snapshot, txid):
+    """Whether transaction `txid` had committed when the (xmin, xmax, in-progress) txid snapshot was taken"""
+    xmin, xmax, active = snapshot
+    return txid < xmin or (txid < xmax and txid not in active)
+
+def format_event(name, data):
+    """Serialize one server-sent event"""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"